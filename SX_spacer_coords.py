@@ -1,81 +1,178 @@
-import re
-from sys import argv
+import argparse
+from contextlib import ExitStack
+from functools import partial
+from multiprocessing import Pool
+from block_scanner import DEFAULT_PATTERNS, compile_patterns, read_patterns, scan_blocks, spacers
+from fasta import fasta_names, iter_fasta
+from samples import DEFAULT_SAMPLE_SHEET, check_alleles, get_population, read_sample_sheet
 
-def read_fasta(fasta_file):
+def scan_allele(record, samples, compiled):
 	"""
-	Description: Read in sequences from fasta file 
-	Inputs: fasta_file (string) - path to fasta file 
-	Return: names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
+	Description: Find the blocks of every pattern in an allele
+	Inputs: record (tuple) - name and sequence of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			compiled (list of compiled regular expressions) - block patterns, from compile_patterns
+	Return: pop (string) - population of the allele
+			name (string) - name of the allele
+			found (list of lists of tuples) - start and stop positions of the blocks of each pattern, from scan_blocks
 	"""
-	names = []
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				names.append(line.strip().strip(">"))
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
-	
-	return names, seqs
-
-def matches(seq):
+	name, seq = record
+	return get_population(samples, name), name, scan_blocks(seq, compiled)
+
+def bar_rows(pop, name, positions, width=.7):
+	"""
+	Description: Build the csv rows with the coordinates of the bars to draw for the spacers between blocks
+	Inputs: pop (string) - population of the allele
+			name (string) - name of the allele
+			positions (list of tuples) - start and stop positions of the blocks
+			width (float) - width of each bar when plotting in R
+	Return: rows (list of strings) - five points per spacer: the bar's corners and its midpoint
+	"""
+	gap = 1 - width
+	x = .5 + (gap/2)
+	rows = []
+	for i, point in enumerate(spacers(positions), 1):
+		rows.append(f"{pop},{name},{x},{0}\n")
+		rows.append(f"{pop},{name},{x},{point}\n")
+
+		rows.append(f"{pop},{name},{i},{point}\n")
+
+		x += width
+
+		rows.append(f"{pop},{name},{x},{point}\n")
+		rows.append(f"{pop},{name},{x},{0}\n")
+
+		x += gap
+	return rows
+
+def compact_rows(pop, name, positions):
 	"""
-	Description: Find all SXnE blocks with regular expression 
-	Inputs: seq (string)
-	Return: positions (list of tuples) - start and stop positions of all SXnE blocks
+	Description: Build one csv row per spacer between blocks
+	Inputs: pop (string) - population of the allele
+			name (string) - name of the allele
+			positions (list of tuples) - start and stop positions of the blocks
+	Return: rows (list of strings) - population, allele, spacer number, start (stop of the block before), stop (start of
+				the block after) and length of each spacer
 	"""
-	positions = []
-	p = re.compile("(S.){3,5}E")
-	for m in p.finditer(seq):
-		positions.append((m.start(),m.end()))
-	return positions
+	prefix = f"{pop},{name},"
+	return [f"{prefix}{i},{positions[i-1][1]},{positions[i][0]},{positions[i][0] - positions[i-1][1]}\n" for i in range(1, len(positions))]
 
-def get_population(allele):
+def block_rows(pop, name, pattern_names, found):
 	"""
-	Description: Return which population an allele is from
+	Description: Build one csv row per block of every pattern
+	Inputs: pop (string) - population of the allele
+			name (string) - name of the allele
+			pattern_names (list of strings) - name of each pattern
+			found (list of lists of tuples) - start and stop positions of the blocks of each pattern
+	Return: rows (list of strings) - pattern, population, allele, block number, start, stop and the length of the
+				spacer before the block (blank for the first block)
 	"""
-	pop1 = [1,2,3,4,5,6,7,8]
-	pop2 = [9,10,11,12,13,14,15,16,17,18]
+	rows = []
+	for pattern, positions in zip(pattern_names, found):
+		lengths = [""] + spacers(positions)
+		for i, (start, stop) in enumerate(positions):
+			rows.append(f"{pattern},{pop},{name},{i+1},{start},{stop},{lengths[i]}\n")
+	return rows
 
-	individual = int(allele.split("_")[0])
-	if individual in pop1:
-		return "1"
-	else:
-		return "2"
+def write_parquet(output_file, results, batch_size=65536):
+	"""
+	Description: Output one row per spacer between the blocks of the first pattern to a Parquet file (the columns of
+				compact_rows)
+	Inputs: output_file (string) - path to output file
+			results (iterable of tuples) - (population, allele, blocks of each pattern) from scan_allele
+			batch_size (int) - number of rows written at a time
+	"""
+	try:
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+	except ImportError:
+		raise ImportError("Writing parquet files requires pyarrow (pip install pyarrow)")
 
+	schema = pa.schema([("Population", pa.string()), ("Allele", pa.string()), ("Spacer", pa.int32()), ("Start", pa.int64()),
+				("Stop", pa.int64()), ("Length", pa.int64())])
 
-if __name__ == "__main__":
-	fasta_file = argv[1]
-	names, seqs = read_fasta(fasta_file)
-	width = .7
-	gap = 1 - width
+	def batch(columns):
+		return pa.record_batch([pa.array(column, field.type) for column, field in zip(columns, schema)], schema=schema)
 
-	# Output a table with coordinates of bars to draw when plotting in R
-	with open("SX_spacer_coords.csv", "w") as file:
-		file.write("Population,Allele,Position,Point\n")
-		for i, seq in enumerate(seqs):
-			x = .5 + (gap/2)
-			name = names[i]
-			pop = get_population(name)
-			positions = matches(seq)
+	with pq.ParquetWriter(output_file, schema, compression="zstd", use_dictionary=["Population", "Allele"]) as writer:
+		columns = [[] for _ in range(6)]
+		for pop, name, found in results:
+			positions = found[0]
+			count = max(len(positions) - 1, 0)
+			columns[0] += [pop] * count
+			columns[1] += [name] * count
+			columns[2] += list(range(1, count + 1))
+			columns[3] += [stop for start, stop in positions[:-1]]
+			columns[4] += [start for start, stop in positions[1:]]
+			columns[5] += spacers(positions)
+			if len(columns[0]) >= batch_size:
+				writer.write_batch(batch(columns))
+				columns = [[] for _ in range(6)]
+		writer.write_batch(batch(columns))
 
-			for i in range(1,len(positions)):
-				point = positions[i][0]-positions[i-1][1]
-				
-				file.write(f"{pop},{name},{x},{0}\n")
-				file.write(f"{pop},{name},{x},{point}\n")
+def iter_alleles(fasta_file, scan, workers):
+	"""
+	Description: Scan every allele in the fasta file, yielding the results in fasta order
+	Inputs: fasta_file (string) - path to fasta file
+			scan (function) - takes a (name, seq) record and returns its results
+			workers (int) - number of processes to scan with (1 scans in this process)
+	Return: generator of the result of scan for each allele
+	"""
+	records = iter_fasta(fasta_file)
+	if workers <= 1:
+		for record in records:
+			yield scan(record)
+		return
+
+	# imap returns the results in fasta order as they finish
+	with Pool(workers) as pool:
+		yield from pool.imap(scan, records, chunksize=4)
 
-				file.write(f"{pop},{name},{i},{point}\n")
 
-				x += width
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Calculate the lengths of the spacers between SXnE blocks (or other block patterns) in each allele")
+	parser.add_argument("fasta_file")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	parser.add_argument("--patterns", metavar="PATTERN_FILE",
+					help="scan for the block patterns listed in PATTERN_FILE (lines of name,regular expression) instead of SX,(S.){3,5}E; "
+					"the spacer output has the spacers of the first one")
+	parser.add_argument("--blocks", metavar="BLOCK_FILE", help="also write the block and spacer coordinates of every pattern to BLOCK_FILE")
+	parser.add_argument("--format", choices=["bars", "compact", "parquet"], default="bars",
+					help="bars: five points of the bar to plot per spacer, compact: one row per spacer, parquet: compact as a Parquet file (default: bars)")
+	parser.add_argument("--output", help="output file (default: SX_spacer_coords.csv, or SX_spacer_coords.parquet with --format parquet)")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes to scan the alleles with (default: 1)")
+	args = parser.parse_args()
+	try:
+		# Every allele is checked against the sample sheet before scanning, rather than in the worker that reaches it
+		samples = read_sample_sheet(args.samples)
+		check_alleles(samples, fasta_names(args.fasta_file), args.samples)
+		patterns = read_patterns(args.patterns) if args.patterns else DEFAULT_PATTERNS
+		if not patterns:
+			parser.error(f"No block patterns found in {args.patterns}")
+		compiled = compile_patterns(patterns)
+	except ValueError as error:
+		parser.error(str(error))
+	pattern_names = [name for name, regex in patterns]
+	output_file = args.output or ("SX_spacer_coords.parquet" if args.format == "parquet" else "SX_spacer_coords.csv")
+
+	results = iter_alleles(args.fasta_file, partial(scan_allele, samples=samples, compiled=compiled), args.workers)
+	with ExitStack() as stack:
+		if args.blocks:
+			block_file = stack.enter_context(open(args.blocks, "w", buffering=1 << 20))
+			block_file.write("Pattern,Population,Allele,Block,Start,Stop,Spacer\n")
 
-				file.write(f"{pop},{name},{x},{point}\n")
-				file.write(f"{pop},{name},{x},{0}\n")
+			def write_blocks(results):
+				for pop, name, found in results:
+					block_file.write("".join(block_rows(pop, name, pattern_names, found)))
+					yield pop, name, found
+			results = write_blocks(results)
 
-				x += gap
+		# Output a table of the spacers, or of the coordinates of bars to draw when plotting in R
+		if args.format == "parquet":
+			write_parquet(output_file, results)
+		else:
+			rows = bar_rows if args.format == "bars" else compact_rows
+			file = stack.enter_context(open(output_file, "w", buffering=1 << 20))
+			file.write("Population,Allele,Position,Point\n" if args.format == "bars" else "Population,Allele,Spacer,Start,Stop,Length\n")
+			for pop, name, found in results:
+				file.write("".join(rows(pop, name, found[0])))
@@ -1,77 +1,42 @@
-import re
+import argparse
 from matplotlib.ticker import MultipleLocator, NullLocator
 import matplotlib.pyplot as plt
 import numpy as np
-from sys import argv
+from block_scanner import DEFAULT_PATTERNS, compile_patterns, read_patterns, scan_blocks, spacers
+from fasta import fetch_sequence
+from samples import DEFAULT_SAMPLE_SHEET, get_population, read_sample_sheet
 
 # THIS SCRIPT REQUIRES MATPLOTLIB AND NUMPY
 
-def read_fasta(fasta_file):
-	"""
-	Description: Read in sequences from fasta file 
-	Inputs: fasta_file (string) - path to fasta file 
-	Return: names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
-	"""
-	names = []
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				names.append(line.strip().strip(">"))
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
-	
-	return names, seqs
-
-def matches(seq):
-	"""
-	Description: Find all SXnE blocks with regular expression 
-	Inputs: seq (string)
-	Return: positions (list of tuples) - start and stop positions of all SXnE blocks
-	"""
-	positions = []
-	p = re.compile("(S.){3,5}E")
-	for m in p.finditer(seq):
-		positions.append((m.start(),m.end()))
-	return positions
-
-def get_population(allele):
-	"""
-	Description: Return which population an allele is from
-	"""
-	pop1 = [1,2,3,4,5,6,7,8]
-	pop2 = [9,10,11,12,13,14,15,16,17,18]
-
-	individual = int(allele.split("_")[0])
-	if individual in pop1:
-		return "1"
-	else:
-		return "2"
-
 if __name__ == "__main__":
 	
-	fasta_file = argv[1]
-	allele = argv[2]
-	pop = get_population(allele)
-
-	names, seqs = read_fasta(fasta_file)
-	
-	index = names.index(allele)
-	seq = seqs[index]
-
-	positions = matches(seq)
-	points = []
-
-    # Calculate the distance between each SXnE block (stop - previous start)
-	for i in range(1,len(positions)):
-		point = positions[i][0]-positions[i-1][1]
-		points.append(point)
+	parser = argparse.ArgumentParser(description="Plot the lengths of the spacers between SXnE blocks in one allele")
+	parser.add_argument("fasta_file")
+	parser.add_argument("allele", help="name of allele to plot, format: individual_allele, i.e. 1_1")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	parser.add_argument("--patterns", metavar="PATTERN_FILE", help="block patterns listed in PATTERN_FILE (lines of name,regular expression) instead of SX,(S.){3,5}E")
+	parser.add_argument("--pattern", help="name of the pattern whose spacers are plotted (default: the first one)")
+	args = parser.parse_args()
+	try:
+		patterns = read_patterns(args.patterns) if args.patterns else DEFAULT_PATTERNS
+		if not patterns:
+			parser.error(f"No block patterns found in {args.patterns}")
+		names = [name for name, regex in patterns]
+		if args.pattern is not None and args.pattern not in names:
+			parser.error(f"No block pattern named {args.pattern}, choose from: {', '.join(names)}")
+		if args.pattern is not None:
+			patterns = [patterns[names.index(args.pattern)]]
+		compiled = compile_patterns(patterns[:1])
+		pop = get_population(read_sample_sheet(args.samples), args.allele)
+	except ValueError as error:
+		parser.error(str(error))
+	fasta_file = args.fasta_file
+	allele = args.allele
+
+	seq = fetch_sequence(fasta_file, allele)
+
+	# Calculate the distance between each SXnE block (stop - previous start)
+	points = spacers(scan_blocks(seq, compiled)[0])
 
 	fig, ax = plt.subplots()
 	fig.set_size_inches(12,5)
@@ -88,6 +53,6 @@ if __name__ == "__main__":
 	ax.set_ylim([0, 140])
 	ax.margins(x=0.01)
 	ax.spines[['right', 'top']].set_visible(False)
-	plt.savefig("SX_spacer_" + allele + ".pdf", format='pdf',dpi=1200,bbox_inches='tight', pad_inches=0.25) 
+	plt.savefig(patterns[0][0] + "_spacer_" + allele + ".pdf", format='pdf',dpi=1200,bbox_inches='tight', pad_inches=0.25) 
 
 	
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from fasta import parse_fasta
+
+DEFAULT_CACHE_DIR = ".alignment_cache"
+
+# Command line of each aligner: {executable}, {input} and {output} are filled in. An aligner without {output}
+# writes the alignment to stdout. The stream command reads the sequences from stdin and writes the alignment to stdout.
+ALIGNERS = {
+	"muscle": {"command": ["{executable}", "-align", "{input}", "-output", "{output}"],
+			"stream": ["{executable}", "-align", "/dev/stdin", "-output", "/dev/stdout"],
+			"version": ["{executable}", "-version"]},
+	"mafft": {"command": ["{executable}", "--auto", "--quiet", "{input}"],
+			"stream": ["{executable}", "--auto", "--quiet", "/dev/stdin"],
+			"version": ["{executable}", "--version"]},
+}
+
+def fill(template, **values):
+	"""
+	Description: Fill in the placeholders of a command template
+	Inputs: template (list of strings) - command with {executable}, {input} and {output} placeholders
+			values (strings) - value of each placeholder
+	Return: command (list of strings)
+	"""
+	return [part.format(**values) for part in template]
+
+@lru_cache(maxsize=None)
+def aligner_version(aligner, executable=None):
+	"""
+	Description: Ask an aligner for its version (asked once per process)
+	Inputs: aligner (string) - name of aligner in ALIGNERS
+			executable (string) - path to the aligner executable, None to find the aligner on the PATH
+	Return: version (string) - first line the aligner prints
+	"""
+	command = fill(ALIGNERS[aligner]["version"], executable=executable or aligner)
+	try:
+		result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+	except (OSError, subprocess.TimeoutExpired) as error:
+		raise RuntimeError(f"Could not run {aligner} ({command[0]}): {error}")
+	output = (result.stdout.strip() or result.stderr.strip()).splitlines()
+	return output[0] if output else ""
+
+def cache_file(cache_dir, fasta_file, aligner, version):
+	"""
+	Description: Path of the cache entry for aligning a fasta file
+	Inputs: cache_dir (string) - path to cache directory
+			fasta_file (string) - path to input fasta file
+			aligner (string) - name of aligner
+			version (string) - aligner version, from aligner_version
+	Return: path (string) - <cache_dir>/<hash of input contents, aligner and version>.fasta
+	"""
+	digest = hashlib.sha256()
+	with open(fasta_file, "rb") as file:
+		for block in iter(lambda: file.read(1 << 20), b""):
+			digest.update(block)
+	digest.update(f"\0{aligner}\0{version}".encode())
+	return os.path.join(cache_dir, digest.hexdigest()[:32] + ".fasta")
+
+def kill_group(process):
+	"""
+	Description: Kill an aligner along with every process it started. MAFFT is a shell script that runs the alignment
+				in child processes, which would otherwise keep running (and keep its output pipes open).
+	Inputs: process (subprocess.Popen) - aligner started with start_new_session=True, so it leads its own process group
+	"""
+	try:
+		os.killpg(process.pid, signal.SIGKILL)
+	except ProcessLookupError:
+		pass
+
+def run_aligner(fasta_file, alignment_file, aligner="muscle", executable=None, timeout=None):
+	"""
+	Description: Run an aligner on a fasta file, checking that it finishes in time and succeeds
+	Inputs: fasta_file (string) - path to input fasta file
+			alignment_file (string) - path to write the alignment to (only written if the aligner succeeds)
+			aligner (string) - name of aligner in ALIGNERS
+			executable (string) - path to the aligner executable, None to find the aligner on the PATH
+			timeout (float) - seconds to wait for the aligner, None to wait for as long as it takes
+	"""
+	temp_file = f"{alignment_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+	template = ALIGNERS[aligner]["command"]
+	command = fill(template, executable=executable or aligner, input=fasta_file, output=temp_file)
+	to_stdout = not any("{output}" in part for part in template)
+
+	process = None
+	try:
+		output = open(temp_file, "w") if to_stdout else subprocess.PIPE
+		try:
+			# In its own session, so that a timed out aligner can be killed with all of its child processes
+			process = subprocess.Popen(command, stdout=output, stderr=subprocess.PIPE, text=True, start_new_session=True)
+		finally:
+			if to_stdout:
+				output.close()
+		try:
+			stdout, stderr = process.communicate(timeout=timeout)
+		except subprocess.TimeoutExpired:
+			kill_group(process)
+			process.communicate()
+			raise RuntimeError(f"{aligner} timed out after {timeout} seconds on {fasta_file}")
+		if process.returncode != 0:
+			raise RuntimeError(f"{aligner} failed on {fasta_file} (exit code {process.returncode}): {stderr.strip()}")
+		if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
+			raise RuntimeError(f"{aligner} wrote no alignment for {fasta_file}")
+		os.replace(temp_file, alignment_file)
+	except OSError as error:
+		raise RuntimeError(f"Could not run {aligner} ({command[0]}): {error}")
+	finally:
+		# An aligner interrupted any other way is killed too
+		if process is not None and process.returncode is None:
+			kill_group(process)
+			process.wait()
+		if os.path.exists(temp_file):
+			os.remove(temp_file)
+
+def align(fasta_file, alignment_file, aligner="muscle", executable=None, timeout=None, cache_dir=DEFAULT_CACHE_DIR):
+	"""
+	Description: Align a fasta file, reusing the alignment from the cache if the same input was aligned before with the
+				same aligner version
+	Inputs: fasta_file (string) - path to input fasta file
+			alignment_file (string) - path to write the alignment to
+			aligner (string) - name of aligner in ALIGNERS
+			executable (string) - path to the aligner executable, None to find the aligner on the PATH
+			timeout (float) - seconds to wait for the aligner, None to wait for as long as it takes
+			cache_dir (string) - path to cache directory, None to always run the aligner
+	Return: cached (bool) - True if the alignment came from the cache
+	"""
+	if cache_dir is None:
+		run_aligner(fasta_file, alignment_file, aligner, executable, timeout)
+		return False
+
+	cached = cache_file(cache_dir, fasta_file, aligner, aligner_version(aligner, executable))
+	if os.path.exists(cached):
+		shutil.copyfile(cached, alignment_file)
+		return True
+
+	run_aligner(fasta_file, alignment_file, aligner, executable, timeout)
+	os.makedirs(cache_dir, exist_ok=True)
+	temp_file = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+	shutil.copyfile(alignment_file, temp_file)
+	os.replace(temp_file, cached)
+	return False
+
+def align_many(jobs, aligner="muscle", executable=None, workers=4, timeout=None, cache_dir=DEFAULT_CACHE_DIR):
+	"""
+	Description: Run many alignments at once, at most workers at a time
+	Inputs: jobs (list of tuples) - (input fasta file, output alignment file) of each alignment
+			aligner, executable, timeout, cache_dir - see align
+			workers (int) - number of aligners to run at the same time
+	Return: errors (list) - None for each job that succeeded, otherwise its RuntimeError (in the same order as jobs)
+	"""
+	def run(job):
+		try:
+			align(job[0], job[1], aligner, executable, timeout, cache_dir)
+		except RuntimeError as error:
+			return error
+		return None
+
+	# The aligners run as separate processes, so threads are enough to keep several going
+	with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+		return list(pool.map(run, jobs))
+
+def align_stream(records, aligner="muscle", executable=None, timeout=None):
+	"""
+	Description: Align sequences by piping them through an aligner: the records are written to its stdin while the
+				aligned records are parsed from its stdout as they arrive, so nothing is written to disk
+	Inputs: records (list of tuples) - (name, sequence) of each sequence to align (names must be unique, the output is
+				matched to them by name)
+			aligner, executable, timeout - see run_aligner
+	Return: aligned (list of strings) - aligned sequences, in the order of records
+	"""
+	duplicates = sorted(name for name, count in Counter(name for name, seq in records).items() if count > 1)
+	if duplicates:
+		raise ValueError(f"Sequence names must be unique to align them through {aligner}: {', '.join(duplicates)}")
+	command = fill(ALIGNERS[aligner]["stream"], executable=executable or aligner)
+	try:
+		process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+						start_new_session=True)
+	except OSError as error:
+		raise RuntimeError(f"Could not run {aligner} ({command[0]}): {error}")
+
+	def feed():
+		try:
+			for name, seq in records:
+				process.stdin.write(f">{name}\n{seq}\n")
+			process.stdin.close()
+		except OSError:
+			# The aligner stopped reading, its exit code says why
+			pass
+
+	errors = []
+	expired = threading.Event()
+	def expire():
+		expired.set()
+		kill_group(process)
+
+	# stdin and stderr are serviced by threads so that no pipe fills up while stdout is read
+	threads = [threading.Thread(target=feed, daemon=True), threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)]
+	timer = threading.Timer(timeout, expire) if timeout is not None else None
+	for thread in threads + ([timer] if timer else []):
+		thread.start()
+	try:
+		aligned = dict(parse_fasta(process.stdout))
+		process.wait()
+		for thread in threads:
+			thread.join()
+	finally:
+		if timer:
+			timer.cancel()
+		if process.poll() is None:
+			kill_group(process)
+			process.wait()
+
+	if expired.is_set():
+		raise RuntimeError(f"{aligner} timed out after {timeout} seconds")
+	if process.returncode != 0:
+		raise RuntimeError(f"{aligner} failed (exit code {process.returncode}): {''.join(errors).strip()}")
+	missing = [name for name, seq in records if name not in aligned]
+	if missing:
+		raise RuntimeError(f"{aligner} output is missing {', '.join(missing)}")
+	return [aligned[name] for name, seq in records]
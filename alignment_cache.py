@@ -0,0 +1,100 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+from fasta import iter_fasta
+
+# THIS MODULE REQUIRES NUMPY
+
+def file_hash(path):
+	"""
+	Description: Calculate the sha256 hash of a file's contents
+	Inputs: path (string) - path to file
+	Return: digest (string) - hex digest of the file contents
+	"""
+	sha = hashlib.sha256()
+	with open(path, "rb") as file:
+		for block in iter(lambda: file.read(1 << 20), b""):
+			sha.update(block)
+	return sha.hexdigest()
+
+def encode_alignment(seqs):
+	"""
+	Description: Encode aligned sequences as a matrix of residue bytes
+	Inputs: seqs (list of strings) - aligned sequences (all the same length)
+	Return: matrix (numpy uint8 array, shape (number of seqs, alignment length)) - ASCII code of each residue
+	"""
+	if not seqs:
+		return np.zeros((0, 0), dtype=np.uint8)
+	length = len(seqs[0])
+	for seq in seqs:
+		if len(seq) != length:
+			raise ValueError(f"Sequences in alignment have different lengths ({length} and {len(seq)})")
+	matrix = np.frombuffer("".join(seqs).encode("ascii"), dtype=np.uint8)
+	return matrix.reshape(len(seqs), length)
+
+def cache_paths(fasta_file, digest):
+	"""
+	Description: Paths of the sidecar files holding the cached alignment for a given content hash
+	Inputs: fasta_file (string) - path to alignment fasta file
+			digest (string) - hex digest of the fasta file contents
+	Return: matrix_file (string) - path to .npy file with the residue matrix
+			names_file (string) - path to text file with one name per line
+	"""
+	base = f"{fasta_file}.{digest[:16]}"
+	return base + ".npy", base + ".names"
+
+def _current_digest(fasta_file):
+	"""
+	Description: Return the content hash of the fasta file, rehashing only when its size or modification time changed
+	"""
+	manifest_file = fasta_file + ".cache.json"
+	stat = os.stat(fasta_file)
+	try:
+		with open(manifest_file) as file:
+			manifest = json.load(file)
+		if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+			return manifest["sha256"], manifest_file, stat
+	except (OSError, ValueError, KeyError):
+		pass
+	return file_hash(fasta_file), manifest_file, stat
+
+def load_alignment(fasta_file):
+	"""
+	Description: Load an alignment as a residue matrix, reusing a memory-mapped sidecar cache when the file has not changed
+	Inputs: fasta_file (string) - path to alignment fasta file
+	Return: names (list of strings) - headers from fasta file
+			matrix (numpy uint8 array, shape (number of seqs, alignment length)) - residue matrix (read-only memory map when cached)
+	"""
+	digest, manifest_file, stat = _current_digest(fasta_file)
+	matrix_file, names_file = cache_paths(fasta_file, digest)
+
+	if os.path.exists(matrix_file) and os.path.exists(names_file):
+		with open(names_file) as file:
+			names = file.read().splitlines()
+		return names, np.load(matrix_file, mmap_mode="r")
+
+	names = []
+	seqs = []
+	for name, seq in iter_fasta(fasta_file):
+		names.append(name)
+		seqs.append(seq)
+	matrix = encode_alignment(seqs)
+
+	# Write the new sidecar files and drop any left over from older versions of the file
+	try:
+		for old_file in glob.glob(glob.escape(fasta_file) + ".*.npy") + glob.glob(glob.escape(fasta_file) + ".*.names"):
+			if old_file not in (matrix_file, names_file):
+				os.remove(old_file)
+		np.save(matrix_file + ".tmp.npy", matrix)
+		os.replace(matrix_file + ".tmp.npy", matrix_file)
+		with open(names_file, "w") as file:
+			file.write("".join(name + "\n" for name in names))
+		with open(manifest_file, "w") as file:
+			json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}, file)
+	except OSError:
+		# Cache is optional (e.g. read-only directory)
+		return names, matrix
+
+	return names, np.load(matrix_file, mmap_mode="r")
@@ -0,0 +1,63 @@
+import re
+
+# Serine blocks of the H-fibroin (SX)nE repeats, the pattern SX_spacer_coords.py has always scanned for
+DEFAULT_PATTERNS = [("SX", "(S.){3,5}E")]
+
+def read_patterns(pattern_file):
+	"""
+	Description: Read a list of named block patterns
+	Inputs: pattern_file (string) - path to file with one pattern per line, comma separated: name, regular expression
+				(i.e. GX,(G.){4,}); blank lines and lines starting with # are skipped
+	Return: patterns (list of tuples) - (name, regular expression) for each line
+	"""
+	patterns = []
+	with open(pattern_file) as file:
+		for number, line in enumerate(file, 1):
+			if line.strip() == "" or line.startswith("#"):
+				continue
+			if "," not in line:
+				raise ValueError(f"{pattern_file} line {number}: expected name,regular expression")
+			name, regex = line.strip().split(",", 1)
+			patterns.append((name.strip(), regex.strip()))
+	return patterns
+
+def compile_patterns(patterns):
+	"""
+	Description: Check and compile block patterns
+	Inputs: patterns (list of tuples) - (name, regular expression) of each pattern
+	Return: compiled (list of compiled regular expressions) - in the order of patterns
+	"""
+	names = [name for name, regex in patterns]
+	if len(set(names)) != len(names):
+		raise ValueError("Block pattern names must be unique")
+	compiled = []
+	for name, regex in patterns:
+		try:
+			pattern = re.compile(regex)
+		except re.error as error:
+			raise ValueError(f"Block pattern {name} is not a valid regular expression: {error}")
+		if pattern.fullmatch(""):
+			raise ValueError(f"Block pattern {name} matches an empty block")
+		compiled.append(pattern)
+	return compiled
+
+def scan_blocks(seq, compiled):
+	"""
+	Description: Find the blocks of every pattern in a sequence. Blocks of a pattern do not overlap each other, but
+				blocks of different patterns may overlap. Each pattern is scanned with its own compiled expression,
+				which lets the regex engine skip ahead to the pattern's possible first residues; one expression
+				combining all of the patterns (with a lookahead per pattern) cannot, and was several times slower.
+	Inputs: seq (string)
+			compiled (list of compiled regular expressions) - from compile_patterns
+	Return: blocks (list of lists of tuples) - for each pattern, the start and stop positions of its blocks
+	"""
+	# Empty blocks are skipped (only possible for patterns with lookarounds)
+	return [[match.span() for match in pattern.finditer(seq) if match.end() > match.start()] for pattern in compiled]
+
+def spacers(positions):
+	"""
+	Description: Calculate the length of the spacer between each block and the next
+	Inputs: positions (list of tuples) - start and stop positions of the blocks, from scan_blocks
+	Return: lengths (list of ints) - start of each block minus the stop of the block before it
+	"""
+	return [positions[i][0] - positions[i-1][1] for i in range(1, len(positions))]
@@ -0,0 +1,197 @@
+import argparse
+from math import isqrt
+import numpy as np
+from alignment_cache import load_alignment
+
+# THIS SCRIPT REQUIRES NUMPY (AND SCIPY FOR --order-file)
+
+GAP = ord("-")
+
+# Number of set bits in every byte value, for numpy versions without bitwise_count
+BIT_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount(packed, axis=-1):
+	"""
+	Description: Count the set bits of bit-packed arrays
+	Inputs: packed (numpy uint8 array)
+			axis (int) - axis to sum the counts over
+	Return: counts (numpy int array)
+	"""
+	if hasattr(np, "bitwise_count"):
+		return np.bitwise_count(packed).sum(axis=axis, dtype=np.int64)
+	return BIT_COUNTS[packed].sum(axis=axis, dtype=np.int64)
+
+def encode_planes(matrix):
+	"""
+	Description: Encode the alignment as bit planes packed 8 columns to a byte: each residue type gets a small code,
+				and plane k holds bit k of every column's code, so two rows differ at a column if any of their planes do
+	Inputs: matrix (numpy uint8 array) - alignment residue matrix
+	Return: planes (numpy uint8 array, shape (sequences, bits, packed length)) - bit planes of the residue codes
+			residues (numpy uint8 array, shape (sequences, packed length)) - bit set where the sequence has a residue
+	"""
+	symbols = np.flatnonzero(np.bincount(matrix.ravel(), minlength=256))
+	table = np.zeros(256, dtype=np.uint8)
+	table[symbols] = np.arange(len(symbols))
+	codes = table[matrix]
+	bits = max(1, (len(symbols) - 1).bit_length())
+	planes = np.stack([np.packbits((codes >> k) & 1, axis=1) for k in range(bits)], axis=1)
+	residues = np.packbits(matrix != GAP, axis=1)
+	return planes, residues
+
+def gap_run_starts(gaps):
+	"""
+	Description: Find where the gap runs of every sequence start
+	Inputs: gaps (numpy bool array) - True where the alignment has a gap
+	Return: run_start (numpy int32 array) - for each gap, the column its run of gaps starts at
+			before_start (numpy int32 array) - for each column, the column the run of gaps just before it starts at
+				(the column itself if the column before is not a gap)
+	"""
+	rows, length = gaps.shape
+	columns = np.arange(length, dtype=np.int32)
+	starts = gaps.copy()
+	starts[:, 1:] &= ~gaps[:, :-1]
+	run_start = np.maximum.accumulate(np.where(starts, columns, 0), axis=1).astype(np.int32)
+
+	before_start = np.broadcast_to(columns, (rows, length)).copy()
+	before_start[:, 1:] = np.where(gaps[:, :-1], run_start[:, :-1], columns[1:])
+	return run_start, before_start
+
+def indel_events(gaps1, run_start1, before_start1, gaps2, run_start2, before_start2):
+	"""
+	Description: Count the gap runs in the pairwise alignments (shared gaps removed) of two blocks of sequences. A run
+				where only the second sequence has gaps starts at a column where it does if the first sequence has
+				gaps at every earlier column of the second sequence's run of gaps (those columns are shared gaps),
+				and the same the other way round.
+	Inputs: gaps1, run_start1, before_start1 (numpy arrays, shape (block 1, 1, length)) - gaps and gap_run_starts of the first block
+			gaps2, run_start2, before_start2 (numpy arrays, shape (1, block 2, length)) - same for the second block
+	Return: events (numpy int array, shape (block 1, block 2)) - number of indels in each pairwise alignment
+	"""
+	events = (gaps2 & ~gaps1 & (run_start2 >= before_start1)).sum(axis=2)
+	events += (gaps1 & ~gaps2 & (run_start1 >= before_start2)).sum(axis=2)
+	return events
+
+def distance_matrices(matrix, block_size=None):
+	"""
+	Description: Compare every pair of sequences in the alignment, a block of sequences against another at a time so
+				that memory stays bounded
+	Inputs: matrix (numpy uint8 array) - alignment residue matrix
+			block_size (int) - number of sequences in a block, None to choose from the alignment length
+	Return: matrices (dictionary of numpy arrays, shape (sequences, sequences)) - with keys:
+				p_distance - proportion of differing residues among the columns where both sequences have a residue
+					(nan if there are none)
+				identity - percent of pairwise alignment columns (shared gaps removed) with the same residue in both
+				indel_events - number of gap runs in the pairwise alignment
+	"""
+	matrix = np.asarray(matrix)
+	rows, length = matrix.shape
+	if block_size is None:
+		block_size = max(1, isqrt((1 << 24) // max(length, 1)))
+
+	planes, residues = encode_planes(matrix)
+	gaps = matrix == GAP
+	run_start, before_start = gap_run_starts(gaps)
+
+	mismatches = np.zeros((rows, rows), dtype=np.int64)
+	compared = np.zeros((rows, rows), dtype=np.int64)
+	aligned = np.zeros((rows, rows), dtype=np.int64)
+	events = np.zeros((rows, rows), dtype=np.int64)
+
+	for a in range(0, rows, block_size):
+		block1 = slice(a, a + block_size)
+		for b in range(a, rows, block_size):
+			block2 = slice(b, b + block_size)
+
+			# Bit-packed comparisons of the two blocks
+			both = residues[block1, None] & residues[None, block2]
+			differ = np.zeros(both.shape, dtype=np.uint8)
+			for k in range(planes.shape[1]):
+				differ |= planes[block1, None, k] ^ planes[None, block2, k]
+			mismatches[block1, block2] = popcount(differ & both)
+			compared[block1, block2] = popcount(both)
+			aligned[block1, block2] = popcount(residues[block1, None] | residues[None, block2])
+
+			events[block1, block2] = indel_events(gaps[block1, None], run_start[block1, None], before_start[block1, None],
+											gaps[None, block2], run_start[None, block2], before_start[None, block2])
+
+	# Only blocks on and above the diagonal were compared, copy them below it
+	lower = np.tril_indices(rows, -1)
+	for values in [mismatches, compared, aligned, events]:
+		values[lower] = values.T[lower]
+
+	with np.errstate(invalid="ignore", divide="ignore"):
+		p_distance = mismatches / compared
+	# Rounded like the percent identities of population_alignment_coords.py
+	identity = [round(match/size*100, 2) if size else 0.0 for match, size in zip((compared - mismatches).ravel().tolist(), aligned.ravel().tolist())]
+	identity = np.array(identity).reshape(rows, rows)
+	return {"p_distance": p_distance, "identity": identity, "indel_events": events}
+
+def cluster_order(distances):
+	"""
+	Description: Order the sequences so that similar sequences are next to each other (average linkage clustering
+				with optimal leaf ordering)
+	Inputs: distances (numpy float array, shape (sequences, sequences)) - symmetric distances, nan counts as the largest
+	Return: order (list of ints) - row of each sequence in the new order
+	"""
+	from scipy.cluster.hierarchy import leaves_list, linkage, optimal_leaf_ordering
+	from scipy.spatial.distance import squareform
+
+	if len(distances) < 3:
+		return list(range(len(distances)))
+	distances = np.array(distances, dtype=np.float64)
+	finite = distances[np.isfinite(distances)]
+	distances[~np.isfinite(distances)] = finite.max() if len(finite) else 1.0
+	np.fill_diagonal(distances, 0)
+
+	condensed = squareform(distances, checks=False)
+	tree = optimal_leaf_ordering(linkage(condensed, method="average"), condensed)
+	return leaves_list(tree).tolist()
+
+def output_matrix(csv_file, names, values, precision=None):
+	"""
+	Description: Output a distance matrix to a csv file with the sequence names as the header and first column
+	Inputs: csv_file (string) - path to csv file to output to
+			names (list of strings) - headers from fasta file
+			values (numpy array, shape (sequences, sequences))
+			precision (int) - decimal places to round to, None to write integers
+	"""
+	with open(csv_file, "w") as file:
+		file.write("Allele," + ",".join(names) + "\n")
+		for name, row in zip(names, values.tolist()):
+			if precision is None:
+				cells = [str(value) for value in row]
+			else:
+				cells = ["" if value != value else str(round(value, precision)) for value in row]
+			file.write(name + "," + ",".join(cells) + "\n")
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Calculate a distance matrix between every pair of sequences in a multiple sequence alignment")
+	parser.add_argument("alignment_file")
+	parser.add_argument("--metric", choices=["p-distance", "identity", "indels"], default="p-distance",
+					help="value written to the matrix (default: p-distance)")
+	parser.add_argument("--output", default="distance_matrix.csv", help="output csv file (default: distance_matrix.csv)")
+	parser.add_argument("--order-file", help="also write the sequence names clustered by the metric, one per line, "
+					"for population_alignment_coords.py --order")
+	parser.add_argument("--block-size", type=int, help="number of sequences compared at a time (default: chosen from the alignment length)")
+	args = parser.parse_args()
+
+	names, matrix = load_alignment(args.alignment_file)
+	matrices = distance_matrices(matrix, args.block_size)
+
+	if args.metric == "p-distance":
+		values = matrices["p_distance"]
+		distances = values
+		output_matrix(args.output, names, values, 6)
+	elif args.metric == "identity":
+		values = matrices["identity"]
+		distances = 100 - values
+		output_matrix(args.output, names, values, 2)
+	else:
+		values = matrices["indel_events"]
+		distances = values
+		output_matrix(args.output, names, values)
+
+	if args.order_file:
+		with open(args.order_file, "w") as file:
+			for i in cluster_order(distances):
+				file.write(names[i] + "\n")
@@ -0,0 +1,191 @@
+import gzip
+import os
+
+def is_gzip(fasta_file):
+	"""
+	Description: Check whether a file is gzip (or bgzip) compressed
+	Inputs: fasta_file (string) - path to file
+	Return: True if the file starts with the gzip magic number
+	"""
+	with open(fasta_file, "rb") as file:
+		return file.read(2) == b"\x1f\x8b"
+
+def open_fasta(fasta_file):
+	"""
+	Description: Open a fasta file for reading as text, decompressing gzip/bgzip input transparently
+	Inputs: fasta_file (string) - path to fasta file (plain, gzip or bgzip)
+	Return: file object opened in text mode
+	"""
+	if is_gzip(fasta_file):
+		return gzip.open(fasta_file, "rt")
+	return open(fasta_file)
+
+def parse_fasta(lines):
+	"""
+	Description: Parse fasta records from an iterable of lines
+	Inputs: lines (iterable of strings) - lines of a fasta file
+	Return: generator of (name, seq) tuples - header (without ">") and sequence of each record
+	"""
+	name = None
+	chunks = []
+	for line in lines:
+		if line.startswith(">"):
+			if name is not None:
+				yield name, "".join(chunks)
+			name = line.strip().strip(">")
+			chunks = []
+		elif name is not None:
+			chunks.append(line.strip())
+	if name is not None:
+		yield name, "".join(chunks)
+
+def iter_fasta(fasta_file):
+	"""
+	Description: Stream records from a fasta file one at a time
+	Inputs: fasta_file (string) - path to fasta file (plain, gzip or bgzip)
+	Return: generator of (name, seq) tuples - header (without ">") and sequence of each record
+	"""
+	with open_fasta(fasta_file) as file:
+		yield from parse_fasta(file)
+
+def fasta_names(fasta_file):
+	"""
+	Description: Read only the headers of a fasta file (e.g. to check them before scanning the sequences)
+	Inputs: fasta_file (string) - path to fasta file (plain, gzip or bgzip)
+	Return: names (list of strings) - header (without ">") of each record, in file order
+	"""
+	with open_fasta(fasta_file) as file:
+		return [line.strip().strip(">") for line in file if line.startswith(">")]
+
+def read_fasta(fasta_file):
+	"""
+	Description: Read in sequences from fasta file
+	Inputs: fasta_file (string) - path to fasta file (plain, gzip or bgzip)
+	Return: names (list of strings) - headers from fasta file
+			seqs (list of strings) - sequences from fasta file (in the same order as names)
+	"""
+	names = []
+	seqs = []
+	for name, seq in iter_fasta(fasta_file):
+		names.append(name)
+		seqs.append(seq)
+
+	return names, seqs
+
+def index_fasta(fasta_file):
+	"""
+	Description: Build a .fai-style index of a fasta file and write it next to the file (fasta_file + ".fai")
+	Inputs: fasta_file (string) - path to uncompressed fasta file
+	Return: index (dictionary, key=name, value=(length, offset, line bases, line width)) - location of each record
+			in the file, where offset is the byte offset of the first residue
+	"""
+	index = {}
+	entries = []
+	name = None
+
+	def finish():
+		if name is not None and name not in index:
+			index[name] = (length, offset, line_bases, line_width)
+			entries.append(name)
+
+	with open(fasta_file, "rb") as file:
+		position = 0
+		for line in file:
+			if line.startswith(b">"):
+				finish()
+				name = line.strip().strip(b">").decode()
+				if "\t" in name:
+					raise ValueError(f"Cannot index {fasta_file}: header {name!r} contains a tab")
+				offset = position + len(line)
+				length = 0
+				line_bases = 0
+				line_width = 0
+				last_line = False
+			elif name is not None:
+				bases = len(line.rstrip(b"\r\n"))
+				if line_bases == 0:
+					if bases == 0:
+						offset += len(line)
+					line_bases = bases
+					line_width = len(line)
+				# Only the last line of a record may be shorter than the others
+				newline = len(line) - bases
+				if bases and (last_line or bases > line_bases or (newline and newline != line_width - line_bases)):
+					raise ValueError(f"Cannot index {fasta_file}: record {name} has lines of different lengths")
+				if bases < line_bases:
+					last_line = True
+				length += bases
+			position += len(line)
+		finish()
+
+	# The index is still used for this call if it cannot be saved (i.e. the directory is read-only)
+	try:
+		with open(fasta_file + ".fai", "w") as file:
+			for name in entries:
+				length, offset, line_bases, line_width = index[name]
+				file.write(f"{name}\t{length}\t{offset}\t{line_bases}\t{line_width}\n")
+	except OSError:
+		pass
+
+	return index
+
+def load_index(fasta_file):
+	"""
+	Description: Load the .fai index of a fasta file, building it first if it is missing or older than the fasta file
+	Inputs: fasta_file (string) - path to uncompressed fasta file
+	Return: index (dictionary, key=name, value=(length, offset, line bases, line width)) - see index_fasta
+	"""
+	index_file = fasta_file + ".fai"
+	if not os.path.exists(index_file) or os.path.getmtime(index_file) < os.path.getmtime(fasta_file):
+		return index_fasta(fasta_file)
+
+	index = {}
+	with open(index_file) as file:
+		for line in file:
+			items = line.rstrip("\n").split("\t")
+			index[items[0]] = tuple(int(x) for x in items[1:5])
+	return index
+
+def scan_sequence(fasta_file, name, start=0, stop=None):
+	"""
+	Description: Pull one sequence (or part of it) from a fasta file by reading the records in order until it is found
+	Inputs: fasta_file, name, start, stop - see fetch_sequence
+	Return: seq (string) - seq[start:stop] of the requested record
+	"""
+	for record_name, seq in iter_fasta(fasta_file):
+		if record_name == name:
+			return seq[start:stop]
+	raise ValueError(f"{name} is not in {fasta_file}")
+
+def fetch_sequence(fasta_file, name, start=0, stop=None):
+	"""
+	Description: Pull one sequence (or part of it) from a fasta file without parsing the whole file
+	Inputs: fasta_file (string) - path to fasta file (gzip input, and files that cannot be indexed, are scanned instead)
+			name (string) - header of sequence to pull
+			start (int) - start position (0-based)
+			stop (int) - stop position (exclusive), None for the end of the sequence
+	Return: seq (string) - seq[start:stop] of the requested record
+	"""
+	if is_gzip(fasta_file):
+		return scan_sequence(fasta_file, name, start, stop)
+
+	# Files that cannot be indexed (records with lines of different lengths, or an unreadable index) are scanned instead
+	try:
+		index = load_index(fasta_file)
+	except (OSError, ValueError):
+		return scan_sequence(fasta_file, name, start, stop)
+	if name not in index:
+		raise ValueError(f"{name} is not in {fasta_file}")
+	length, offset, line_bases, line_width = index[name]
+
+	start, stop, _ = slice(start, stop).indices(length)
+	if stop <= start:
+		return ""
+
+	def byte_position(position):
+		return offset + (position // line_bases) * line_width + position % line_bases
+
+	with open(fasta_file, "rb") as file:
+		file.seek(byte_position(start))
+		data = file.read(byte_position(stop) - byte_position(start))
+	return data.replace(b"\n", b"").replace(b"\r", b"").decode()
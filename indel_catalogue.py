@@ -0,0 +1,156 @@
+import hashlib
+import os
+from array import array
+import numpy as np
+
+# THIS MODULE REQUIRES NUMPY
+
+def insertion_hash(insertion):
+	"""
+	Description: Fast 64 bit content hash of an insertion
+	Inputs: insertion (string or bytes)
+	Return: key (int)
+	"""
+	if isinstance(insertion, str):
+		insertion = insertion.encode("ascii")
+	return int.from_bytes(hashlib.blake2b(insertion, digest_size=8).digest(), "little")
+
+class InsertionCatalogue:
+	"""
+	Description: Catalogue of distinct insertions, each stored once and identified by its ID (the order it was added
+				in). Insertions are looked up through an index keyed by insertion_hash; the rare insertions that share a
+				hash are told apart by comparing them with the stored insertion. Counts are kept in a compact array.
+				The counts merged in from each source (i.e. alignment file) are also kept, so that merging a source
+				again replaces its counts instead of adding them a second time.
+	"""
+
+	def __init__(self):
+		self.insertions = []
+		self.counts = array("q")
+		# key=insertion_hash, value=ID (or list of IDs when different insertions share the hash)
+		self.index = {}
+		# key=source name, value=(alignment key, counts merged from the source)
+		self.sources = {}
+
+	def __len__(self):
+		return len(self.insertions)
+
+	def __getitem__(self, ID):
+		return self.insertions[ID]
+
+	def add(self, insertion, count=1):
+		"""
+		Description: Add to the count of an insertion, giving it the next ID if it is new
+		Inputs: insertion (string)
+				count (int) - amount to add to its count
+		Return: ID (int)
+		"""
+		key = insertion_hash(insertion)
+		IDs = self.index.get(key)
+		if IDs is not None:
+			for ID in [IDs] if isinstance(IDs, int) else IDs:
+				if self.insertions[ID] == insertion:
+					self.counts[ID] += count
+					return ID
+
+		ID = len(self.insertions)
+		self.insertions.append(insertion)
+		self.counts.append(count)
+		if IDs is None:
+			self.index[key] = ID
+		elif isinstance(IDs, int):
+			self.index[key] = [IDs, ID]
+		else:
+			IDs.append(ID)
+		return ID
+
+	def items(self):
+		"""
+		Description: Iterate over the catalogue in ID order
+		Return: generator of tuples - (ID, count, insertion)
+		"""
+		for ID, insertion in enumerate(self.insertions):
+			yield ID, self.counts[ID], insertion
+
+	def extend_from(self, other):
+		"""
+		Description: Add the insertions another catalogue has beyond this one (with count 0), so that both give the
+					same IDs. The other catalogue must start with the same insertions as this one.
+		Inputs: other (InsertionCatalogue)
+		"""
+		if other.insertions[:len(self)] != self.insertions:
+			raise ValueError("Catalogues do not share their IDs")
+		for insertion in other.insertions[len(self):]:
+			self.add(insertion, 0)
+
+	def merge_into(self, other, source, key):
+		"""
+		Description: Add this catalogue's insertions and counts to another catalogue as the counts of one source,
+					replacing whatever that source added before. The other catalogue must hold a prefix of this one's
+					insertions (i.e. this catalogue was started from it with extend_from).
+		Inputs: other (InsertionCatalogue) - catalogue to add to (updated in place)
+				source (string) - name of the source the counts come from
+				key (int) - 64 bit key of the alignment the counts come from; an alignment already merged into other
+					under a different source name is not counted again
+		Return: counted_as (string) - source the counts are held under in other: source, or the other source that
+					already holds the same alignment (in which case nothing was added)
+		"""
+		if self.insertions[:len(other)] != other.insertions:
+			raise ValueError("Catalogues do not share their IDs")
+		for ID in range(len(other), len(self)):
+			other.add(self.insertions[ID], 0)
+		for name, (merged_key, merged_counts) in other.sources.items():
+			if merged_key == key and name != source:
+				return name
+
+		merged = np.frombuffer(other.counts, dtype=np.int64).copy()
+		if source in other.sources:
+			previous = np.frombuffer(other.sources[source][1], dtype=np.int64)
+			merged[:len(previous)] -= previous
+		merged += np.frombuffer(self.counts, dtype=np.int64)
+		other.counts = array("q", merged.tobytes())
+		other.sources[source] = (key, array("q", self.counts))
+		return source
+
+	def save(self, catalogue_file):
+		"""
+		Description: Write the catalogue to a compressed npz file (atomically)
+		Inputs: catalogue_file (string) - path to catalogue file
+		"""
+		encoded = [insertion.encode("ascii") for insertion in self.insertions]
+		offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(insertion) for insertion in encoded])
+		temp_file = f"{catalogue_file}.{os.getpid()}.tmp.npz"
+		names = sorted(self.sources)
+		source_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+		source_offsets[1:] = np.cumsum([len(self.sources[name][1]) for name in names])
+		source_counts = [np.frombuffer(self.sources[name][1], dtype=np.int64) for name in names]
+		np.savez_compressed(temp_file, residues=np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets=offsets,
+						counts=np.frombuffer(self.counts, dtype=np.int64), sources=np.array(names, dtype=str),
+						source_keys=np.array([self.sources[name][0] for name in names], dtype=np.uint64), source_offsets=source_offsets,
+						source_counts=np.concatenate(source_counts) if source_counts else np.zeros(0, dtype=np.int64))
+		os.replace(temp_file, catalogue_file)
+
+	@classmethod
+	def load(cls, catalogue_file):
+		"""
+		Description: Read a catalogue written by save
+		Inputs: catalogue_file (string) - path to catalogue file
+		Return: catalogue (InsertionCatalogue)
+		"""
+		catalogue = cls()
+		with np.load(catalogue_file) as data:
+			residues = data["residues"].tobytes().decode("ascii")
+			offsets = data["offsets"].tolist()
+			counts = data["counts"]
+			# Catalogues saved before sources were recorded keep their counts, but cannot replace what they came from
+			if "sources" in data.files:
+				keys = data["source_keys"].tolist()
+				source_offsets = data["source_offsets"].tolist()
+				source_counts = data["source_counts"]
+				for i, name in enumerate(data["sources"].tolist()):
+					merged = array("q", source_counts[source_offsets[i]:source_offsets[i+1]].tobytes())
+					catalogue.sources[name] = (keys[i], merged)
+		for i, count in enumerate(counts.tolist()):
+			catalogue.add(residues[offsets[i]:offsets[i+1]], count)
+		return catalogue
@@ -0,0 +1,90 @@
+import numpy as np
+
+# THIS MODULE REQUIRES NUMPY
+
+# Length columns of the pull_indels.py table
+LENGTHS = {"full": 5, "amino": 6}
+
+def make_bins(max_len=100, bin_width=1, log_bins=None):
+	"""
+	Description: Make the bin edges of a length histogram, starting at length 1
+	Inputs: max_len (int) - longest length counted
+			bin_width (int) - lengths per bin
+			log_bins (int) - number of logarithmically spaced bins (fewer if some round to the same length), None for bins
+				of bin_width
+	Return: edges (numpy int array) - bin i holds lengths edges[i] <= length < edges[i+1]
+	"""
+	if log_bins is not None:
+		edges = np.unique(np.round(np.geomspace(1, max_len + 1, log_bins + 1)).astype(np.int64))
+	else:
+		edges = np.arange(1, max_len + 1 + bin_width, bin_width, dtype=np.int64)
+		edges[-1] = min(edges[-1], max_len + 1)
+	return edges
+
+def read_indel_table(csv_file):
+	"""
+	Description: Read the indel table of a pull_indels.py csv file in one pass, keeping only the columns the
+				histograms need
+	Inputs: csv_file (string) - path to csv file from pull_indels.py
+	Return: table (dictionary) - with keys:
+				populations, individuals (lists of strings) - each distinct population/individual, in order of appearance
+				population, individual (numpy int arrays) - index of each indel's population/individual in those lists
+				full, amino (numpy int arrays) - full length and amino acid length of each indel
+	"""
+	groups = {"population": {}, "individual": {}}
+	columns = {name: [] for name in ["population", "individual", "full", "amino"]}
+	with open(csv_file) as file:
+		file.readline()
+		for line in file:
+			items = line.strip().split(",")
+			# The table ends at the blank lines before the insertion list
+			if len(items) == 1:
+				break
+			columns["population"].append(groups["population"].setdefault(items[0], len(groups["population"])))
+			columns["individual"].append(groups["individual"].setdefault(items[1], len(groups["individual"])))
+			columns["full"].append(int(items[LENGTHS["full"]]))
+			columns["amino"].append(int(items[LENGTHS["amino"]]))
+
+	table = {name: np.array(values, dtype=np.int64) for name, values in columns.items()}
+	table["populations"] = list(groups["population"])
+	table["individuals"] = list(groups["individual"])
+	return table
+
+def histograms(table, edges):
+	"""
+	Description: Count the indel lengths in every bin, overall, per population and per individual, for both full and
+				amino acid lengths. Each histogram is a single bincount of the bin indices (offset by group).
+	Inputs: table (dictionary) - from read_indel_table
+			edges (numpy int array) - bin edges, from make_bins
+	Return: counts (dictionary, key=(length, grouping), value=dictionary of group name to numpy int array of counts per
+				bin) - length is full or amino, grouping is all (with the single group All), population or individual
+	"""
+	bins = len(edges) - 1
+	counts = {}
+	for length in LENGTHS:
+		index = np.searchsorted(edges, table[length], side="right") - 1
+		inside = (index >= 0) & (index < bins)
+		index = index[inside]
+		counts[(length, "all")] = {"All": np.bincount(index, minlength=bins)}
+
+		for grouping, names in [("population", table["populations"]), ("individual", table["individuals"])]:
+			group = table[grouping][inside]
+			grouped = np.bincount(group * bins + index, minlength=len(names) * bins).reshape(len(names), bins)
+			counts[(length, grouping)] = dict(zip(names, grouped))
+	return counts
+
+def output_histograms(csv_file, counts, edges):
+	"""
+	Description: Output the histograms to a long format csv file
+	Inputs: csv_file (string) - path to output csv file
+			counts (dictionary) - from histograms
+			edges (numpy int array) - bin edges, from make_bins
+	"""
+	with open(csv_file, "w") as file:
+		file.write("Length,Grouping,Group,Start,Stop,Count\n")
+		starts = edges[:-1].tolist()
+		stops = (edges[1:] - 1).tolist()
+		for (length, grouping), groups in counts.items():
+			for group, values in groups.items():
+				file.write("".join(f"{length},{grouping},{group},{start},{stop},{count}\n"
+							for start, stop, count in zip(starts, stops, values.tolist())))
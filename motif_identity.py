@@ -0,0 +1,173 @@
+import numpy as np
+
+# THIS MODULE REQUIRES NUMPY
+
+# Motifs at most this long are counted with direct correlation, longer ones with FFTs
+DIRECT_MAX_LENGTH = 64
+
+def encode(seq):
+	"""
+	Description: Encode a sequence as an array of residue bytes
+	Inputs: seq (string)
+	Return: codes (numpy uint8 array) - ASCII code of each residue
+	"""
+	return np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+
+def percent_table(motif_length):
+	"""
+	Description: Rounded percent identity for every possible number of matching residues
+	Inputs: motif_length (int)
+	Return: table (numpy float array, length motif_length + 1) - table[count] is the percent identity (count/motif_length*100,
+				rounded to 2 places) of a window with count matches
+	"""
+	return np.array([round(count/motif_length*100, 2) for count in range(motif_length+1)])
+
+def match_counts(seq, motif):
+	"""
+	Description: Count the residues matching the motif in every k-mer of the seq
+	Inputs: seq, motif (string or numpy uint8 array from encode)
+	Return: counts (numpy int array, length len(seq)-len(motif)+1) - number of matching residues in each window
+	"""
+	return match_counts_batch(seq, [motif])[0]
+
+def identity_track(seq, motif):
+	"""
+	Description: Calculate the percent identity of the motif with every k-mer in the seq
+	Inputs: seq, motif (string)
+	Return: percents (numpy float array, length len(seq)-len(motif)+1) - percent identity of each window, from percent_table
+	"""
+	return percent_table(len(motif))[match_counts(seq, motif)]
+
+def match_counts_batch(seq, motifs):
+	"""
+	Description: Count matching residues for several motifs in one pass over the seq (the encoded seq, its
+				per-residue indicator arrays and their FFTs are computed once and shared between motifs)
+	Inputs: seq (string or numpy uint8 array from encode)
+			motifs (list of strings or numpy uint8 arrays from encode)
+	Return: counts (list of numpy int arrays) - match_counts(seq, motif) for each motif (in the same order as motifs)
+	"""
+	seq_codes = encode(seq) if isinstance(seq, str) else seq
+	motif_codes = [encode(motif) if isinstance(motif, str) else motif for motif in motifs]
+	if any(len(codes) == 0 for codes in motif_codes):
+		raise ValueError("Motif is empty")
+
+	indicators = {}
+	spectra = {}
+	size = 1 << (len(seq_codes) + max([len(codes) for codes in motif_codes], default=1) - 1).bit_length()
+
+	def indicator(residue):
+		if residue not in indicators:
+			indicators[residue] = seq_codes == residue
+		return indicators[residue]
+
+	def spectrum(residue):
+		if residue not in spectra:
+			spectra[residue] = np.fft.rfft(indicator(residue).astype(np.float64), size)
+		return spectra[residue]
+
+	all_counts = []
+	for codes in motif_codes:
+		k = len(codes)
+		windows = len(seq_codes) - k + 1
+		if windows <= 0:
+			all_counts.append(np.zeros(0, dtype=np.int64))
+			continue
+
+		residues = np.unique(codes)
+		if k <= DIRECT_MAX_LENGTH:
+			counts = np.zeros(windows, dtype=np.int64)
+			for residue in residues:
+				counts += np.correlate(indicator(residue).astype(np.int64), (codes == residue).astype(np.int64), mode="valid")
+		else:
+			total = np.zeros(size//2 + 1, dtype=np.complex128)
+			for residue in residues:
+				total += spectrum(residue) * np.fft.rfft((codes[::-1] == residue).astype(np.float64), size)
+			counts = np.rint(np.fft.irfft(total, size)[k-1:k-1+windows]).astype(np.int64)
+		all_counts.append(counts)
+
+	return all_counts
+
+def identity_tracks(seq, motifs):
+	"""
+	Description: Calculate the percent identity track of several motifs against the seq in one pass
+	Inputs: seq (string)
+			motifs (list of strings)
+	Return: tracks (list of numpy float arrays) - identity_track(seq, motif) for each motif (in the same order as motifs)
+	"""
+	return [percent_table(len(motif))[counts] for motif, counts in zip(motifs, match_counts_batch(seq, motifs))]
+
+def find_peaks(positions, percents):
+	"""
+	Description: Keep only the local maxima of an identity track. A plateau (a run of neighbouring windows with the same
+				percent) is a peak if the windows on either side of the whole run are lower, and is reported at its
+				first window.
+	Inputs: positions (numpy int array) - window positions, in increasing order
+			percents (numpy float array) - percent identity at each position; windows missing from positions are 
+				taken to be lower than every window given
+	Return: positions, percents (numpy arrays) - the windows that are local maxima
+	"""
+	if len(positions) == 0:
+		return positions, percents
+	adjacent = positions[1:] == positions[:-1] + 1
+
+	# Collapse each plateau to one run and compare it with the windows just before and after it
+	run_start = np.ones(len(positions), dtype=bool)
+	run_start[1:] = ~(adjacent & (percents[1:] == percents[:-1]))
+	starts = np.flatnonzero(run_start)
+	ends = np.append(starts[1:], len(positions)) - 1
+	left = np.full(len(starts), -np.inf)
+	right = np.full(len(starts), -np.inf)
+	has_left = starts > 0
+	has_left[has_left] = adjacent[starts[has_left] - 1]
+	left[has_left] = percents[starts[has_left] - 1]
+	has_right = ends < len(positions) - 1
+	has_right[has_right] = adjacent[ends[has_right]]
+	right[has_right] = percents[ends[has_right] + 1]
+
+	peak = starts[(percents[starts] > left) & (percents[starts] > right)]
+	return positions[peak], percents[peak]
+
+def threshold_hits(seq, motif, min_percent=None, peaks=False):
+	"""
+	Description: Find the windows of the seq that reach a minimum percent identity with the motif and/or are local
+				maxima of the identity track. With a minimum, windows are dropped as soon as the residues still to be 
+				compared cannot bring them up to it, so only the candidates are fully counted.
+	Inputs: seq, motif (string)
+			min_percent (float) - minimum percent identity of a hit, None for no minimum
+			peaks (bool) - only report windows that are local maxima of the identity track
+	Return: positions (numpy int array) - start position of each hit
+			percents (numpy float array) - percent identity of each hit (same values as identity_track)
+	"""
+	table = percent_table(len(motif))
+	if min_percent is None:
+		percents = table[match_counts(seq, motif)]
+		positions = np.arange(len(percents))
+	else:
+		seq_codes = encode(seq)
+		motif_codes = encode(motif)
+		k = len(motif_codes)
+		needed = np.searchsorted(table, min_percent)
+		candidates = np.arange(max(len(seq_codes) - k + 1, 0))
+		if needed > k:
+			candidates = candidates[:0]
+		counts = np.zeros(len(candidates), dtype=np.int64)
+
+		# Compare the most common motif residues first so hopeless windows are dropped as early as possible
+		residues, frequencies = np.unique(motif_codes, return_counts=True)
+		remaining = k
+		for residue in residues[np.argsort(-frequencies, kind="stable")]:
+			if len(candidates) == 0:
+				break
+			offsets = np.flatnonzero(motif_codes == residue)
+			remaining -= len(offsets)
+			counts += (seq_codes[candidates[:, None] + offsets[None, :]] == residue).sum(axis=1)
+			keep = counts + remaining >= needed
+			candidates = candidates[keep]
+			counts = counts[keep]
+
+		positions = candidates
+		percents = table[counts]
+
+	if peaks:
+		positions, percents = find_peaks(positions, percents)
+	return positions, percents
@@ -1,116 +1,340 @@
+import argparse
 from sys import argv
+from functools import partial
+from multiprocessing import Pool
 import matplotlib.pyplot as plt
 from scipy.stats import gaussian_kde
+from fasta import fasta_names, fetch_sequence, iter_fasta
+from motif_identity import identity_tracks, threshold_hits
+from motif_scan_io import write_parquet, write_npz
+from motif_search import hamming_search
+from samples import DEFAULT_SAMPLE_SHEET, check_alleles, get_population, read_sample_sheet
+from scan_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, cached_identity_tracks, evict
+import numpy as np
 
 
-def read_fasta(fasta_file):
-	"""
-	Description: Read in sequences from fasta file 
-	Inputs: fasta_file (string) - path to fasta file 
-	Return: names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
-	"""
-	names = []
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				names.append(line.strip().strip(">"))
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
-	
-	return names, seqs
-
-def pull_motif(seq_name, names, seqs, start, stop):
+def pull_motif(seq_name, fasta_file, start, stop):
 	"""
 	Description: Pull motif at given start and stop positions from given sequence
 	Inputs: seq_name (string) - header of seq to pull from 
-			names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
+			fasta_file (string) - path to fasta file
 			start (int) - start position of motif to pull
 			stop (int) - stop position of motif to pull
 	Return: motif (string) - motif pulled from seq
 			
 	"""
-	index = names.index(seq_name)
-	seq = seqs[index]
-	motif = seq[start:stop]
-	return motif
+	return fetch_sequence(fasta_file, seq_name, start, stop)
 
-def percent_id(seq1, seq2):
+def compute_tracks(seq, motifs, cache_dir=None):
 	"""
-	Description: Calculate the percent identity of two sequences
-	Inputs: seq1, seq2 (strings) 
-	Return: percent (float)
+	Description: Calculate the percent identity tracks of several motifs against the seq, through the scan cache if one is given
+	Inputs: seq (string)
+			motifs (list of strings)
+			cache_dir (string) - path to scan cache directory, None to always compute
+	Return: tracks (list of numpy float arrays) - one track for each motif
 	"""
-	matches = 0
-	
-	for i in range(len(seq1)):
-		a = seq1[i]
-		b = seq2[i]
+	if cache_dir is None:
+		return identity_tracks(seq, motifs)
+	return cached_identity_tracks(seq, motifs, cache_dir)
 
-		if a == b:
-			matches += 1 
-
-	return round(matches/len(seq1)*100,2)
-
-def slide_motif(name, seq, motif):
+def slide_motif(name, seq, motif, cache_dir=None):
 	"""
 	Description: Calculate the percent identity of the motif with every k-mer in the seq
 	Inputs: seq, motif (string)
-	Return: percents (list of floats)
+			cache_dir (string) - path to scan cache directory, None to always compute
+	Return: percents (list of strings)
+	"""
+	track = compute_tracks(seq, [motif], cache_dir)[0]
+	return [str(percent) for percent in track.tolist()]
+
+def read_motif_list(motif_file, fasta_file):
+	"""
+	Description: Read a list of motifs to scan in batch mode and pull each one from its source allele
+	Inputs: motif_file (string) - path to file with one motif per line, comma separated: source allele, 
+				coordinates (start-stop), and optionally a motif ID (defaults to allele:start-stop); 
+				blank lines and lines starting with # are skipped
+			fasta_file (string) - path to fasta file
+	Return: motifs (list of tuples) - (motif ID, motif) for each line
+	"""
+	motifs = []
+	with open(motif_file) as file:
+		for number, line in enumerate(file, 1):
+			if line.strip() == "" or line.startswith("#"):
+				continue
+			items = [item.strip() for item in line.split(",")]
+			if len(items) < 2:
+				raise ValueError(f"{motif_file} line {number}: expected allele,start-stop[,ID]")
+			seq_name, coordinates = items[0], items[1]
+			motif_ID = items[2] if len(items) > 2 else f"{seq_name}:{coordinates}"
+			try:
+				start, stop = (int(position) for position in coordinates.split("-"))
+			except ValueError:
+				raise ValueError(f"{motif_file} line {number}: coordinates {coordinates!r} are not of the form start-stop") from None
+			try:
+				motif = pull_motif(seq_name, fasta_file, start, stop)
+			except ValueError as error:
+				raise ValueError(f"{motif_file} line {number}: {error}") from None
+			if not motif:
+				raise ValueError(f"{motif_file} line {number}: {seq_name}:{coordinates} is an empty motif")
+			motifs.append((motif_ID, motif))
+	return motifs
+
+def scan_rows(record, samples, motif, cache_dir=None):
+	"""
+	Description: Scan one allele with one motif and format the csv rows
+	Inputs: record (tuple) - (name, seq) of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motif (string)
+			cache_dir (string) - path to scan cache directory, None to always compute
+	Return: rows (string) - Population,Allele,Position,Percent rows for every window
 	"""
-	percents = []
-	for i in range(len(seq)-len(motif)+1):
-		window = seq[i:i+len(motif)]
-		percent = percent_id(motif, window)
-		percents.append(str(percent))
+	name, seq = record
+	pop = get_population(samples, name)
+	percents = slide_motif(name, seq, motif, cache_dir)
+	return "".join([f"{pop},{name},{i},{percent}\n" for i, percent in enumerate(percents)])
 
-	return percents
+def batch_scan_rows(record, samples, motifs, cache_dir=None):
+	"""
+	Description: Scan one allele with every motif and format the csv rows
+	Inputs: record (tuple) - (name, seq) of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motifs (list of tuples) - (motif ID, motif) pairs
+			cache_dir (string) - path to scan cache directory, None to always compute
+	Return: rows (string) - Motif,Population,Allele,Position,Percent rows for every motif and window
+	"""
+	name, seq = record
+	pop = get_population(samples, name)
+	tracks = compute_tracks(seq, [motif for motif_ID, motif in motifs], cache_dir)
+	rows = []
+	for (motif_ID, motif), track in zip(motifs, tracks):
+		rows += [f"{motif_ID},{pop},{name},{i},{percent}\n" for i, percent in enumerate(track.tolist())]
+	return "".join(rows)
 
+def hit_rows(record, samples, motifs, min_percent, peaks):
+	"""
+	Description: Scan one allele with every motif and format csv rows for the qualifying windows only
+	Inputs: record (tuple) - (name, seq) of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motifs (list of tuples) - (motif ID, motif) pairs, with motif ID None for a single motif scan
+			min_percent (float) - minimum percent identity of a hit, None for no minimum
+			peaks (bool) - only report windows that are local maxima of the identity track
+	Return: rows (string) - [Motif,]Population,Allele,Position,Percent rows for every hit
+	"""
+	name, seq = record
+	pop = get_population(samples, name)
+	rows = []
+	for motif_ID, motif in motifs:
+		prefix = f"{pop},{name}" if motif_ID is None else f"{motif_ID},{pop},{name}"
+		positions, percents = threshold_hits(seq, motif, min_percent, peaks)
+		rows += [f"{prefix},{i},{percent}\n" for i, percent in zip(positions.tolist(), percents.tolist())]
+	return "".join(rows)
 
-def get_population(allele):
+def search_rows(record, samples, motifs, max_mismatches):
+	"""
+	Description: Search one allele for every window within max_mismatches substitutions of each motif and format the csv rows
+	Inputs: record (tuple) - (name, seq) of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motifs (list of tuples) - (motif ID, motif) pairs, with motif ID None for a single motif search
+			max_mismatches (int) - maximum number of substitutions
+	Return: rows (string) - [Motif,]Population,Allele,Position,Mismatches rows for every hit
 	"""
-	Description: Return which population an allele is from
+	name, seq = record
+	pop = get_population(samples, name)
+	rows = []
+	for motif_ID, motif in motifs:
+		prefix = f"{pop},{name}" if motif_ID is None else f"{motif_ID},{pop},{name}"
+		rows += [f"{prefix},{i},{mismatches}\n" for i, mismatches in hamming_search(seq, motif, max_mismatches)]
+	return "".join(rows)
+
+def scan_tracks(record, samples, motifs, cache_dir=None):
 	"""
-	pop1 = [1,2,3,4,5,6,7,8]
-	pop2 = [9,10,11,12,13,14,15,16,17,18]
+	Description: Scan one allele with every motif, keeping the percents as arrays (for binary output)
+	Inputs: record (tuple) - (name, seq) of the allele
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motifs (list of tuples) - (motif ID, motif) pairs, with motif ID None for a single motif scan
+			cache_dir (string) - path to scan cache directory, None to always compute
+	Return: tracks (list of tuples) - (motif ID, population, allele, percents) for each motif
+	"""
+	name, seq = record
+	pop = get_population(samples, name)
+	tracks = compute_tracks(seq, [motif for motif_ID, motif in motifs], cache_dir)
+	return [(motif_ID, pop, name, track.astype(np.float32)) for (motif_ID, motif), track in zip(motifs, tracks)]
+
+def iter_scan(fasta_file, scan, workers):
+	"""
+	Description: Scan every allele in the fasta file, yielding the results in fasta order
+	Inputs: fasta_file (string) - path to fasta file
+			scan (function) - takes a (name, seq) record and returns its results
+			workers (int) - number of processes to scan with (1 scans in this process)
+	Return: generator of the result of scan for each allele
+	"""
+	records = iter_fasta(fasta_file)
+	if workers <= 1:
+		for record in records:
+			yield scan(record)
+		return
+
+	# Each allele is thousands of windows of work, so one allele per task keeps the workers
+	# evenly loaded; imap returns the results in fasta order as they finish
+	with Pool(workers) as pool:
+		yield from pool.imap(scan, records, chunksize=1)
 
-	individual = int(allele.split("_")[0])
-	if individual in pop1:
-		return "1"
+def write_output(output_file, output_format, fasta_file, samples, motifs, workers, min_percent=None, peaks=False,
+				cache_dir=None, cache_size=DEFAULT_MAX_BYTES):
+	"""
+	Description: Scan every allele and write the results as csv, npz or parquet
+	Inputs: output_file (string) - path to output file
+			output_format (string) - csv, npz or parquet
+			fasta_file (string) - path to fasta file
+			samples (dictionary) - sample sheet from read_sample_sheet
+			motifs (list of tuples) - (motif ID, motif) pairs, with motif ID None for a single motif scan
+			workers (int) - number of processes to scan with
+			min_percent (float) - only output windows with at least this percent identity (csv only)
+			peaks (bool) - only output windows that are local maxima of the identity track (csv only)
+			cache_dir (string) - path to scan cache directory, None to always compute
+			cache_size (int) - size limit of the scan cache in bytes, trimmed to it once the scan is done
+	"""
+	if output_format == "csv":
+		if motifs[0][0] is None:
+			header = "Population,Allele,Position,Percent\n"
+			scan = partial(scan_rows, samples=samples, motif=motifs[0][1], cache_dir=cache_dir)
+		else:
+			header = "Motif,Population,Allele,Position,Percent\n"
+			scan = partial(batch_scan_rows, samples=samples, motifs=motifs, cache_dir=cache_dir)
+		if min_percent is not None or peaks:
+			scan = partial(hit_rows, samples=samples, motifs=motifs, min_percent=min_percent, peaks=peaks)
+		with open(output_file, "w") as file:
+			file.write(header)
+			for rows in iter_scan(fasta_file, scan, workers):
+				file.write(rows)
 	else:
-		return "2"
+		results = iter_scan(fasta_file, partial(scan_tracks, samples=samples, motifs=motifs, cache_dir=cache_dir), workers)
+		tracks = (track for result in results for track in result)
+		if output_format == "npz":
+			write_npz(output_file, tracks)
+		else:
+			write_parquet(output_file, tracks)
 
+	# Trim the cache once for the whole scan instead of after every allele
+	if cache_dir is not None:
+		evict(cache_dir, cache_size)
 
-if __name__ == "__main__":
-	fasta_file = argv[1]
-	seq_to_pull = argv[2] # name of sequence to pull from, format: individual_allele, i.e. 1_1
-	coordinates = argv[3] # coordinates of motif, format: start-stop, i.e. 300-400
 
-	names, seqs = read_fasta(fasta_file)
-	
-	start = int(coordinates.split("-")[0])
-	stop = int(coordinates.split("-")[1])
+def load_samples(parser, sample_file, fasta_file):
+	"""
+	Description: Read the sample sheet and check that every allele in the fasta file is in it before scanning, reporting
+				problems through the parser instead of partway through the scan (or from a worker process)
+	Inputs: parser (argparse.ArgumentParser) - parser of the command
+			sample_file (string) - path to sample sheet csv
+			fasta_file (string) - path to fasta file
+	Return: samples (dictionary) - sample sheet from read_sample_sheet
+	"""
+	try:
+		samples = read_sample_sheet(sample_file)
+		check_alleles(samples, fasta_names(fasta_file), sample_file)
+	except ValueError as error:
+		parser.error(str(error))
+	return samples
+
+def scan_command(arguments):
+	"""
+	Description: Run the sliding window percent identity scan (the default command)
+	Inputs: arguments (list of strings) - command line arguments
+	"""
+	parser = argparse.ArgumentParser(description="Calculate the percent identity of a motif with every k-mer in each allele",
+				epilog="Run 'motif_scan_coords.py search -h' for the approximate motif search")
+	parser.add_argument("fasta_file")
+	parser.add_argument("seq_to_pull", nargs="?", help="name of sequence to pull from, format: individual_allele, i.e. 1_1")
+	parser.add_argument("coordinates", nargs="?", help="coordinates of motif, format: start-stop, i.e. 300-400")
+	parser.add_argument("--batch", metavar="MOTIF_FILE", help="scan every motif listed in MOTIF_FILE (lines of allele,start-stop[,ID]) in one pass")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes to scan alleles with (default: 1)")
+	parser.add_argument("--format", choices=["csv", "npz", "parquet"], default="csv", help="output format (default: csv)")
+	parser.add_argument("--min-percent", type=float, help="only output windows with at least this percent identity")
+	parser.add_argument("--peaks", action="store_true", help="only output windows that are local maxima of the identity track")
+	parser.add_argument("--output", help="output file (default: motif_scan_coords.<format>, or motif_scan_batch.<format> with --batch)")
+	parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"directory of cached identity tracks (default: {DEFAULT_CACHE_DIR})")
+	parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024*1024), help="size limit of the cache in MB (default: %(default)s)")
+	parser.add_argument("--no-cache", action="store_true", help="always recompute the identity tracks")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	args = parser.parse_args(arguments)
+	samples = load_samples(parser, args.samples, args.fasta_file)
+	cache_dir = None if args.no_cache else args.cache_dir
+	cache_size = args.cache_size * 1024 * 1024
+	fasta_file = args.fasta_file
+	if (args.min_percent is not None or args.peaks) and args.format != "csv":
+		parser.error("--min-percent and --peaks only apply to csv output")
+
+	if args.batch:
+		try:
+			motifs = read_motif_list(args.batch, fasta_file)
+		except ValueError as error:
+			parser.error(str(error))
+		if not motifs:
+			parser.error(f"No motifs found in {args.batch}")
+		print(f"Motifs: {len(motifs)}")
+		for motif_ID, motif in motifs:
+			print(f"  {motif_ID}  Length: {len(motif)}")
+
+		# Output one long table with percent ID data for every motif, scanning each allele once
+		output_file = args.output or f"motif_scan_batch.{args.format}"
+	else:
+		if args.coordinates is None:
+			parser.error("seq_to_pull and coordinates are required unless --batch is given")
 
-	motif = pull_motif(seq_to_pull, names, seqs, start, stop)
+		start = int(args.coordinates.split("-")[0])
+		stop = int(args.coordinates.split("-")[1])
 
-	print(f"Motif:\n  Length: {len(motif)}\n  {motif}")
+		motif = pull_motif(args.seq_to_pull, fasta_file, start, stop)
 
-	# Output a table with percent ID data to use when plotting in R
-	with open("motif_scan_coords.csv", "w") as file:
-		file.write("Population,Allele,Position,Percent\n")
-		for i, seq in enumerate(seqs):
-			name = names[i]
-			pop = get_population(name)
-			percents = slide_motif(name, seq, motif)
-			for i, percent in enumerate(percents):
-				file.write(f"{pop},{name},{i},{percent}\n")
+		print(f"Motif:\n  Length: {len(motif)}\n  {motif}")
 
+		motifs = [(None, motif)]
 
+		# Output a table with percent ID data to use when plotting in R
+		output_file = args.output or f"motif_scan_coords.{args.format}"
 
+	write_output(output_file, args.format, fasta_file, samples, motifs, args.workers, args.min_percent, args.peaks, cache_dir, cache_size)
+
+def search_command(arguments):
+	"""
+	Description: Run the approximate motif search (the search command), writing every window within a mismatch budget
+	Inputs: arguments (list of strings) - command line arguments after "search"
+	"""
+	parser = argparse.ArgumentParser(prog="motif_scan_coords.py search", description="Find every window of each allele within k substitutions of a motif")
+	parser.add_argument("fasta_file")
+	parser.add_argument("seq_to_pull", nargs="?", help="name of sequence to pull from, format: individual_allele, i.e. 1_1")
+	parser.add_argument("coordinates", nargs="?", help="coordinates of motif, format: start-stop, i.e. 300-400")
+	parser.add_argument("-k", "--max-mismatches", type=int, required=True, help="maximum number of substitutions")
+	parser.add_argument("--batch", metavar="MOTIF_FILE", help="search for every motif listed in MOTIF_FILE (lines of allele,start-stop[,ID])")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes to search alleles with (default: 1)")
+	parser.add_argument("--output", default="motif_search_hits.csv", help="output csv file (default: motif_search_hits.csv)")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	args = parser.parse_args(arguments)
+	samples = load_samples(parser, args.samples, args.fasta_file)
+	fasta_file = args.fasta_file
+
+	if args.batch:
+		try:
+			motifs = read_motif_list(args.batch, fasta_file)
+		except ValueError as error:
+			parser.error(str(error))
+		header = "Motif,Population,Allele,Position,Mismatches\n"
+	else:
+		if args.coordinates is None:
+			parser.error("seq_to_pull and coordinates are required unless --batch is given")
+		start = int(args.coordinates.split("-")[0])
+		stop = int(args.coordinates.split("-")[1])
+		motifs = [(None, pull_motif(args.seq_to_pull, fasta_file, start, stop))]
+		header = "Population,Allele,Position,Mismatches\n"
+
+	with open(args.output, "w") as file:
+		file.write(header)
+		for rows in iter_scan(fasta_file, partial(search_rows, samples=samples, motifs=motifs, max_mismatches=args.max_mismatches), args.workers):
+			file.write(rows)
+
+
+if __name__ == "__main__":
+	if argv[1:2] == ["search"]:
+		search_command(argv[2:])
+	else:
+		scan_command(argv[1:])
@@ -0,0 +1,117 @@
+import numpy as np
+
+# THIS MODULE REQUIRES NUMPY (AND PYARROW FOR PARQUET FILES)
+
+def write_npz(npz_file, tracks):
+	"""
+	Description: Write motif scan tracks to a compressed npz file with one float32 track per allele
+	Inputs: npz_file (string) - path to output npz file
+			tracks (iterable of tuples) - (motif ID or None, population, allele, percents) for each scanned allele,
+				where percents is a numpy array with the percent identity of every window
+	"""
+	motifs = []
+	populations = []
+	alleles = []
+	offsets = [0]
+	percents = []
+	for motif_ID, pop, name, track in tracks:
+		motifs.append("" if motif_ID is None else motif_ID)
+		populations.append(pop)
+		alleles.append(name)
+		offsets.append(offsets[-1] + len(track))
+		percents.append(np.asarray(track, dtype=np.float32))
+
+	columns = {
+		"populations": np.array(populations, dtype=str),
+		"alleles": np.array(alleles, dtype=str),
+		"offsets": np.array(offsets, dtype=np.int64),
+		"percent": np.concatenate(percents) if percents else np.zeros(0, dtype=np.float32),
+	}
+	if any(motifs):
+		columns["motifs"] = np.array(motifs, dtype=str)
+	np.savez_compressed(npz_file, **columns)
+
+def write_parquet(parquet_file, tracks):
+	"""
+	Description: Write motif scan tracks to a Parquet file with one row group per allele
+	Inputs: parquet_file (string) - path to output parquet file
+			tracks (iterable of tuples) - (motif ID or None, population, allele, percents) for each scanned allele
+	"""
+	try:
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+	except ImportError:
+		raise ImportError("Writing parquet files requires pyarrow (pip install pyarrow)")
+
+	fields = [("Population", pa.string()), ("Allele", pa.string()), ("Position", pa.int32()), ("Percent", pa.float32())]
+	writer = None
+	for motif_ID, pop, name, track in tracks:
+		if writer is None:
+			if motif_ID is not None:
+				fields.insert(0, ("Motif", pa.string()))
+			schema = pa.schema(fields)
+			# Positions are consecutive, so delta encoding stores them in almost no space
+			writer = pq.ParquetWriter(parquet_file, schema, compression="zstd", use_dictionary=["Motif", "Population", "Allele", "Percent"],
+						column_encoding={"Position": "DELTA_BINARY_PACKED"})
+
+		size = len(track)
+		columns = [pa.array([pop] * size, pa.string()), pa.array([name] * size, pa.string()),
+				pa.array(np.arange(size, dtype=np.int32)), pa.array(np.asarray(track, dtype=np.float32))]
+		if motif_ID is not None:
+			columns.insert(0, pa.array([motif_ID] * size, pa.string()))
+		writer.write_batch(pa.record_batch(columns, schema=schema), row_group_size=max(size, 1))
+
+	if writer is None:
+		writer = pq.ParquetWriter(parquet_file, pa.schema(fields))
+	writer.close()
+
+def iter_tracks(scan_file):
+	"""
+	Description: Read the tracks back from an npz or parquet motif scan file
+	Inputs: scan_file (string) - path to file written by write_npz or write_parquet
+	Return: generator of tuples - (motif ID or None, population, allele, percents) for each scanned allele,
+			with percents rounded back to the 2 decimal places of the csv output
+	"""
+	if scan_file.endswith(".npz"):
+		with np.load(scan_file) as data:
+			offsets = data["offsets"]
+			percent = data["percent"]
+			motifs = data["motifs"] if "motifs" in data else [None] * len(data["alleles"])
+			for i, (pop, name) in enumerate(zip(data["populations"], data["alleles"])):
+				track = np.round(percent[offsets[i]:offsets[i+1]].astype(np.float64), 2)
+				motif_ID = None if motifs[i] is None else str(motifs[i])
+				yield motif_ID, str(pop), str(name), track
+		return
+
+	import pyarrow.parquet as pq
+	parquet = pq.ParquetFile(scan_file)
+	for i in range(parquet.num_row_groups):
+		group = parquet.read_row_group(i)
+		if group.num_rows == 0:
+			continue
+		motif_ID = group.column("Motif")[0].as_py() if "Motif" in group.column_names else None
+		track = np.round(group.column("Percent").to_numpy().astype(np.float64), 2)
+		yield motif_ID, group.column("Population")[0].as_py(), group.column("Allele")[0].as_py(), track
+
+def load_motif_scan(scan_file):
+	"""
+	Description: Load an npz or parquet motif scan file as long-format columns (the same table as the csv output)
+	Inputs: scan_file (string) - path to file written by write_npz or write_parquet
+	Return: table (dictionary, key=column name, value=numpy array) - columns Motif (batch scans only), Population,
+				Allele, Position, Percent
+	"""
+	columns = {"Motif": [], "Population": [], "Allele": [], "Position": [], "Percent": []}
+	batch = False
+	for motif_ID, pop, name, track in iter_tracks(scan_file):
+		batch = motif_ID is not None
+		size = len(track)
+		columns["Motif"].append(np.repeat(np.array([motif_ID or ""]), size))
+		columns["Population"].append(np.repeat(np.array([pop]), size))
+		columns["Allele"].append(np.repeat(np.array([name]), size))
+		columns["Position"].append(np.arange(size))
+		columns["Percent"].append(track)
+
+	table = {key: np.concatenate(values) if values else np.zeros(0) for key, values in columns.items()}
+	if not batch:
+		del table["Motif"]
+	return table
@@ -1,116 +1,84 @@
-from sys import argv
+import argparse
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator, NullLocator
+from fasta import fetch_sequence
+from motif_identity import identity_track, threshold_hits
+from samples import DEFAULT_SAMPLE_SHEET, get_population, read_sample_sheet
+from scan_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, cached_identity_tracks, evict
 
-# THIS SCRIPT REQUIRES MATPLOTLIB
+# THIS SCRIPT REQUIRES MATPLOTLIB AND NUMPY
 
-def read_fasta(fasta_file):
-	"""
-	Description: Read in sequences from fasta file 
-	Inputs: fasta_file (string) - path to fasta file 
-	Return: names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
-	"""
-	names = []
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				names.append(line.strip().strip(">"))
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
-	
-	return names, seqs
-
-def pull_motif(seq_name, names, seqs, start, stop):
+def pull_motif(seq_name, fasta_file, start, stop):
 	"""
 	Description: Pull motif at given start and stop positions from given sequence
 	Inputs: seq_name (string) - header of seq to pull from 
-			names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
+			fasta_file (string) - path to fasta file
 			start (int) - start position of motif to pull
 			stop (int) - stop position of motif to pull
 	Return: motif (string) - motif pulled from seq
 			
 	"""
+	return fetch_sequence(fasta_file, seq_name, start, stop)
 
-	index = names.index(seq_name)
-	seq = seqs[index]
-	motif = seq[start:stop]
-	return motif
-
-def percent_id(seq1, seq2):
-	"""
-	Description: Calculate the percent identity of two sequences
-	Inputs: seq1, seq2 (strings) 
-	Return: percent (float)
-	"""
-
-	matches = 0
-	for i in range(len(seq1)):
-		a = seq1[i]
-		b = seq2[i]
-
-		if a == b:
-			matches += 1 
-	
-	percent = round(matches/len(seq1)*100, 2)
-	return percent
-
-def slide_motif(seq, motif):
+def slide_motif(seq, motif, cache_dir=None, cache_size=DEFAULT_MAX_BYTES):
 	"""
 	Description: Calculate the percent identity of the motif with every k-mer in the seq
 	Inputs: seq, motif (string)
+			cache_dir (string) - path to scan cache directory (shared with motif_scan_coords.py), None to always compute
+			cache_size (int) - size limit of the scan cache in bytes
 	Return: percents (list of floats)
 	"""
-	percents = []
-	for i in range(len(seq)-len(motif)+1):
-		window = seq[i:i+len(motif)]
-		percents.append(percent_id(motif, window))
-
+	if cache_dir is None:
+		return identity_track(seq, motif).tolist()
+	percents = cached_identity_tracks(seq, [motif], cache_dir)[0].tolist()
+	evict(cache_dir, cache_size)
 	return percents
 
-def get_population(allele):
-	"""
-	Description: Return which population an allele is from
-	"""
-	pop1 = [1,2,3,4,5,6,7,8]
-	pop2 = [9,10,11,12,13,14,15,16,17,18]
-
-	individual = int(allele.split("_")[0])
-	if individual in pop1:
-		return "1"
-	else:
-		return "2"
-
 if __name__ == "__main__":
-	fasta_file = argv[1]
-	seq_to_pull = argv[2] # name of sequence to pull from, format: individual_allele, i.e. 1_1
-	coordinates = argv[3] # coordinates of motif (aa), format: start-stop, i.e. 300-400
-	seq_to_scan = argv[4] # name of sequence to scan, format: individual_allele, i.e. 1_1
+	parser = argparse.ArgumentParser(description="Plot the percent identity of a motif with every k-mer in one allele")
+	parser.add_argument("fasta_file")
+	parser.add_argument("seq_to_pull", help="name of sequence to pull from, format: individual_allele, i.e. 1_1")
+	parser.add_argument("coordinates", help="coordinates of motif (aa), format: start-stop, i.e. 300-400")
+	parser.add_argument("seq_to_scan", help="name of sequence to scan, format: individual_allele, i.e. 1_1")
+	parser.add_argument("--min-percent", type=float, help="only plot windows with at least this percent identity")
+	parser.add_argument("--peaks", action="store_true", help="only plot windows that are local maxima of the identity track")
+	parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"directory of cached identity tracks (default: {DEFAULT_CACHE_DIR})")
+	parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024*1024), help="size limit of the cache in MB (default: %(default)s)")
+	parser.add_argument("--no-cache", action="store_true", help="always recompute the identity track")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	args = parser.parse_args()
+	fasta_file = args.fasta_file
+	seq_to_pull = args.seq_to_pull
+	coordinates = args.coordinates
+	seq_to_scan = args.seq_to_scan
+	hits_only = args.min_percent is not None or args.peaks
+	try:
+		pop = get_population(read_sample_sheet(args.samples), seq_to_scan)
+	except ValueError as error:
+		parser.error(str(error))
 	
-	names, seqs = read_fasta(fasta_file)
 	start = int(coordinates.split("-")[0])
 	stop = int(coordinates.split("-")[1])
 	
-	motif = pull_motif(seq_to_pull, names, seqs, start, stop)
+	motif = pull_motif(seq_to_pull, fasta_file, start, stop)
 
 	print(f"Motif:\n  Length: {len(motif)}\n  {motif}")
 
-	index = names.index(seq_to_scan)
-	seq = seqs[index]
-	pop = get_population(seq_to_scan)
-
-	percents = slide_motif(seq, motif)
+	seq = fetch_sequence(fasta_file, seq_to_scan)
 
 	fig, ax = plt.subplots()
 	fig.set_size_inches(16,4)
-	ax.plot(list(range(len(percents))), percents, lw=.5, color="#020080")
+	if hits_only:
+		# Plot only the qualifying windows as vertical lines
+		positions, percents = threshold_hits(seq, motif, args.min_percent, args.peaks)
+		print(f"Hits: {len(positions)}")
+		for position, percent in zip(positions.tolist(), percents.tolist()):
+			print(f"  {position}  {percent}")
+		ax.vlines(positions, 0, percents, lw=.5, color="#020080")
+		ax.set_xlim(0, max(len(seq)-len(motif), 1))
+	else:
+		percents = slide_motif(seq, motif, None if args.no_cache else args.cache_dir, args.cache_size * 1024 * 1024)
+		ax.plot(list(range(len(percents))), percents, lw=.5, color="#020080")
 	ax.set_title(f"Population: {pop}  Allele: {seq_to_scan}", loc="right", size=18)
 	ax.set_xlabel(f"Position in AA Sequence\n\nMotif: {motif}", size=18)
 	ax.set_ylabel("Percent Identity", size=18)
@@ -121,6 +89,7 @@ if __name__ == "__main__":
 	ax.yaxis.set_minor_locator(MultipleLocator(10))
 	ax.spines[['right', 'top']].set_visible(False)
 	ax.margins(x=0.003)
-	plt.savefig(f"motif_scan_single({seq_to_pull},{coordinates},{seq_to_scan}).pdf", format="pdf", dpi=1200,bbox_inches='tight', pad_inches=0.25)
+	suffix = "_hits" if hits_only else ""
+	plt.savefig(f"motif_scan_single({seq_to_pull},{coordinates},{seq_to_scan}){suffix}.pdf", format="pdf", dpi=1200,bbox_inches='tight', pad_inches=0.25)
 
 	
@@ -0,0 +1,58 @@
+def mismatch_masks(motif, width):
+	"""
+	Description: Build the per-amino-acid bitmasks for a shift-add search
+	Inputs: motif (string)
+			width (int) - number of bits in each motif position's counter field
+	Return: masks (dictionary, key=amino acid, value=int) - 1 in the field of every motif position the amino acid does NOT match
+			default (int) - mask for amino acids that are not in the motif (1 in every field)
+	"""
+	default = 0
+	for j in range(len(motif)):
+		default |= 1 << (j * width)
+
+	masks = {}
+	for amino in set(motif):
+		mask = default
+		for j, motif_amino in enumerate(motif):
+			if motif_amino == amino:
+				mask &= ~(1 << (j * width))
+		masks[amino] = mask
+	return masks, default
+
+def hamming_search(seq, motif, max_mismatches):
+	"""
+	Description: Find every window of the seq that differs from the motif by at most max_mismatches substitutions.
+				Uses bit-parallel shift-add counting: one counter field per motif position is packed into a single
+				Python integer (which spans as many machine words as a long motif needs), so every position is
+				updated with a handful of integer operations per residue of the seq.
+	Inputs: seq, motif (string)
+			max_mismatches (int) - maximum number of substitutions
+	Return: hits (list of tuples) - (start position, number of mismatches) of each matching window
+	"""
+	m = len(motif)
+	if m == 0:
+		raise ValueError("Motif is empty")
+
+	# Each field holds a mismatch count in its low bits and an overflow flag in its top bit, which is
+	# set once the count is too large to matter and then carried along with the field
+	width = max_mismatches.bit_length() + 1
+	masks, default = mismatch_masks(motif, width)
+	field = (1 << width) - 1
+	overflow_bits = default << (width - 1)
+	all_bits = (1 << (m * width)) - 1
+	last_shift = (m - 1) * width
+	last_overflow = 1 << (width - 1)
+
+	hits = []
+	state = 0
+	overflow = 0
+	for t, amino in enumerate(seq):
+		state = ((state << width) & all_bits) + masks.get(amino, default)
+		overflow = ((overflow << width) | (state & overflow_bits)) & all_bits
+		state &= ~overflow_bits
+
+		if t >= m - 1 and not (overflow >> last_shift) & last_overflow:
+			mismatches = (state >> last_shift) & field
+			if mismatches <= max_mismatches:
+				hits.append((t - m + 1, mismatches))
+	return hits
@@ -0,0 +1,283 @@
+import numpy as np
+
+# THIS MODULE REQUIRES NUMPY
+
+GAP = "-"
+
+# Score below any reachable alignment score, with room to subtract penalties without overflowing
+NEG = -(1 << 29)
+
+# Bits of the traceback code stored for every cell
+FROM_DIAGONAL, FROM_E, FROM_F = 0, 1, 2
+E_EXTENDED = 4
+F_EXTENDED = 8
+
+BLOSUM62_TEXT = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+
+def read_matrix(text):
+	"""
+	Description: Read a substitution matrix in the NCBI text format
+	Inputs: text (string) - header line of residues, then one line per residue with its scores
+	Return: residues (string) - residue of each row/column
+			scores (numpy int32 array, shape (residues, residues))
+	"""
+	lines = [line.split() for line in text.strip().splitlines()]
+	residues = "".join(lines[0])
+	scores = np.array([[int(score) for score in line[1:]] for line in lines[1:]], dtype=np.int32)
+	return residues, scores
+
+BLOSUM62 = read_matrix(BLOSUM62_TEXT)
+
+def encode(seq, residues):
+	"""
+	Description: Convert a sequence to row indices of a substitution matrix (residues not in the matrix count as X)
+	Inputs: seq (string) - amino acid sequence
+			residues (string) - residue of each row of the matrix
+	Return: codes (numpy intp array)
+	"""
+	table = np.full(256, residues.index("X") if "X" in residues else 0, dtype=np.intp)
+	for i, residue in enumerate(residues):
+		table[ord(residue)] = i
+		table[ord(residue.lower())] = i
+	return table[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+
+def fill_band(codes1, codes2, scores, gap_open, gap_extend, low, high):
+	"""
+	Description: Fill the affine gap (Gotoh) dynamic programming matrices inside a band of diagonals, one anti-diagonal
+				at a time. Every cell of an anti-diagonal only depends on the two anti-diagonals before it, so each one
+				is computed with a few vectorized operations, and only the traceback codes of the band are stored.
+	Inputs: codes1, codes2 (numpy int arrays) - encoded sequences, from encode
+			scores (numpy int32 array) - substitution matrix
+			gap_open (int) - penalty of the first residue of a gap
+			gap_extend (int) - penalty of every further residue of a gap
+			low, high (ints) - band of cells (i, j) with low <= j - i <= high
+	Return: score (int) - score of the best global alignment inside the band
+			traceback (numpy uint8 array, shape (anti-diagonals, band width)) - traceback code of each cell
+			starts (numpy int array) - row i of the first band cell of each anti-diagonal
+	"""
+	n, m = len(codes1), len(codes2)
+	reverse2 = codes2[::-1]
+	width = (high - low) // 2 + 1
+	traceback = np.zeros((n + m + 1, width), dtype=np.uint8)
+	starts = np.zeros(n + m + 1, dtype=np.int64)
+
+	# Scores of anti-diagonals d-2, d-1 and d, indexed by row i + 1 so that row -1 is a valid index. Cells just outside
+	# each band are set to NEG, which is all the next two anti-diagonals read outside of it.
+	H2, H1, H0 = (np.full(n + 3, NEG, dtype=np.int32) for _ in range(3))
+	E1, E0, F1, F0 = (np.full(n + 3, NEG, dtype=np.int32) for _ in range(4))
+	H1[1] = 0
+
+	for d in range(1, n + m + 1):
+		start = max(0, d - m, -((high - d) // 2))
+		stop = min(n, d, (d - low) // 2)
+		starts[d] = start
+		codes = traceback[d]
+
+		# Cells away from the first row and column
+		first, last = max(start, 1), min(stop, d - 1)
+		if first <= last:
+			rows = slice(first + 1, last + 2)
+			previous = slice(first, last + 1)
+
+			E_open = H1[rows] - gap_open
+			E_extend = E1[rows] - gap_extend
+			E = np.maximum(E_open, E_extend)
+			F_open = H1[previous] - gap_open
+			F_extend = F1[previous] - gap_extend
+			F = np.maximum(F_open, F_extend)
+			H = H2[previous] + scores[codes1[first - 1:last], reverse2[m - d + first:m - d + last + 1]]
+
+			source = np.full(len(H), FROM_DIAGONAL, dtype=np.uint8)
+			better = E > H
+			H = np.where(better, E, H)
+			source[better] = FROM_E
+			better = F > H
+			H = np.where(better, F, H)
+			source[better] = FROM_F
+			source[E_extend > E_open] |= E_EXTENDED
+			source[F_extend > F_open] |= F_EXTENDED
+
+			H0[rows] = H
+			E0[rows] = E
+			F0[rows] = F
+			codes[first - start:last - start + 1] = source
+
+		# First row (gap in sequence 1) and first column (gap in sequence 2)
+		end_gap = -gap_open - (d - 1) * gap_extend
+		if start == 0:
+			H0[1] = E0[1] = end_gap
+			F0[1] = NEG
+			codes[0] = FROM_E | (E_EXTENDED if d > 1 else 0)
+		if stop == d:
+			H0[d + 1] = F0[d + 1] = end_gap
+			E0[d + 1] = NEG
+			codes[d - start] = FROM_F | (F_EXTENDED if d > 1 else 0)
+
+		for values in [H0, E0, F0]:
+			values[start] = NEG
+			values[stop + 2] = NEG
+		H2, H1, H0 = H1, H0, H2
+		E1, E0 = E0, E1
+		F1, F0 = F0, F1
+
+	return int(H1[n + 1]), traceback, starts
+
+def pair_bounds(codes1, codes2, scores):
+	"""
+	Description: Bound the substitution scores any alignment of the two sequences can collect: each residue scores at
+				most its best substitution with a residue of the other sequence
+	Inputs: codes1, codes2 (numpy int arrays) - encoded sequences, from encode
+			scores (numpy int32 array) - substitution matrix
+	Return: top1, top2 (numpy int arrays) - top1[k] is the largest total of the best scores of k residues of sequence 1
+				(counting negative scores as 0), top2[k] the same for sequence 2
+	"""
+	tops = []
+	for codes, other in [(codes1, codes2), (codes2, codes1)]:
+		best = scores[codes][:, np.unique(other)].max(axis=1) if len(other) else np.zeros(len(codes), dtype=np.int64)
+		best = np.sort(np.maximum(best, 0))[::-1]
+		tops.append(np.concatenate([[0], np.cumsum(best, dtype=np.int64)]))
+	return tops
+
+def outside_bound(top1, top2, n, m, low, high, gap_open, gap_extend):
+	"""
+	Description: Upper bound on the score of any alignment whose path leaves the band of diagonals low..high. To reach
+				diagonal high + 1 and still end on diagonal m - n, a path needs at least high + 1 gap residues in
+				sequence 1 and high + 1 - (m - n) in sequence 2 (and likewise below the band), which leaves fewer
+				residue pairs to score and at least two gaps to pay for.
+	Inputs: top1, top2 (numpy int arrays) - from pair_bounds
+			n, m (ints) - lengths of the sequences
+			low, high (ints) - band of cells (i, j) with low <= j - i <= high
+			gap_open, gap_extend (ints) - gap penalties (not negative)
+	Return: bound (int) - None if the band covers the whole matrix, so no alignment can leave it
+	"""
+	gaps = []
+	if high < m:
+		gaps.append(2 * (high + 1) - (m - n))
+	if low > -n:
+		gaps.append(2 * (1 - low) + (m - n))
+	if not gaps:
+		return None
+	gaps = min(gaps)
+	pairs = (n + m - gaps) // 2
+	# Splitting the gap residues into more gaps only costs more, unless extending a gap costs more than opening one
+	penalty = 2 * gap_open + (gaps - 2) * gap_extend if gap_extend <= gap_open else gaps * gap_open
+	return int(min(top1[pairs], top2[pairs])) - penalty
+
+def band_limits(n, m, band):
+	"""
+	Description: Diagonals covered by a band around the length difference of the sequences
+	Inputs: n, m (ints) - lengths of the sequences
+			band (int) - diagonals on either side
+	Return: low, high (ints) - band of cells (i, j) with low <= j - i <= high
+	"""
+	low = max(min(0, m - n) - band, -n)
+	high = min(max(0, m - n) + band, m)
+	# Cells on an anti-diagonal are two diagonals apart, so the band needs two diagonals to cover every one
+	if high - low < 1:
+		high += 1
+	return low, high
+
+def trace_back(seq1, seq2, traceback, starts):
+	"""
+	Description: Follow the traceback codes from the last cell to the first to build the alignment
+	Inputs: seq1, seq2 (strings) - sequences that were aligned
+			traceback, starts - from fill_band
+	Return: aligned1, aligned2 (strings) - aligned sequences with gaps as "-"
+	"""
+	i, j = len(seq1), len(seq2)
+	aligned1, aligned2 = [], []
+	state = FROM_DIAGONAL
+	while i > 0 or j > 0:
+		d = i + j
+		code = int(traceback[d, i - starts[d]])
+
+		if state == FROM_DIAGONAL:
+			state = code & 3
+			if state == FROM_DIAGONAL:
+				i -= 1
+				j -= 1
+				aligned1.append(seq1[i])
+				aligned2.append(seq2[j])
+		elif state == FROM_E:
+			j -= 1
+			aligned1.append(GAP)
+			aligned2.append(seq2[j])
+			if not code & E_EXTENDED:
+				state = FROM_DIAGONAL
+		else:
+			i -= 1
+			aligned1.append(seq1[i])
+			aligned2.append(GAP)
+			if not code & F_EXTENDED:
+				state = FROM_DIAGONAL
+
+	return "".join(reversed(aligned1)), "".join(reversed(aligned2))
+
+def global_align(seq1, seq2, matrix=BLOSUM62, gap_open=11, gap_extend=1, band=100):
+	"""
+	Description: Globally align two amino acid sequences with affine gap penalties, using banded dynamic programming.
+				The band covers the diagonals between the start and the end of the alignment plus band diagonals on
+				either side. It is widened until no alignment leaving it can score higher than the best one inside it
+				(see outside_bound), so the result is always an optimal alignment.
+	Inputs: seq1, seq2 (strings) - sequences to align
+			matrix (tuple) - (residues, scores) substitution matrix, from read_matrix (default BLOSUM62)
+			gap_open (int) - penalty of the first residue of a gap
+			gap_extend (int) - penalty of every further residue of a gap
+			band (int) - diagonals on either side of the band to start with, None for the full matrix
+	Return: aligned1, aligned2 (strings) - aligned sequences with gaps as "-", for get_indels
+			score (int) - alignment score
+	"""
+	residues, scores = matrix
+	codes1, codes2 = encode(seq1, residues), encode(seq2, residues)
+	n, m = len(seq1), len(seq2)
+	# Gaps that score better when longer or split up cannot be bounded, so those always use the full matrix
+	full = max(n, m)
+	band = full if band is None or min(gap_open, gap_extend) < 0 else min(max(band, 1), full)
+	top1, top2 = pair_bounds(codes1, codes2, scores)
+
+	while True:
+		low, high = band_limits(n, m, band)
+		score, traceback, starts = fill_band(codes1, codes2, scores, gap_open, gap_extend, low, high)
+		bound = outside_bound(top1, top2, n, m, low, high, gap_open, gap_extend)
+		if bound is None or bound <= score:
+			break
+
+		# The bound falls as the band widens and a wider band scores at least as high, so widening to the narrowest
+		# band whose bound is at most this score is enough
+		narrow, band = band, full
+		while band - narrow > 1:
+			middle = (narrow + band) // 2
+			bound = outside_bound(top1, top2, n, m, *band_limits(n, m, middle), gap_open, gap_extend)
+			if bound is None or bound <= score:
+				band = middle
+			else:
+				narrow = middle
+
+	aligned1, aligned2 = trace_back(seq1, seq2, traceback, starts)
+	return aligned1, aligned2, score
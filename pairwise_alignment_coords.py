@@ -1,35 +1,73 @@
-from sys import argv
+import argparse
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
+from aligner import ALIGNERS, DEFAULT_CACHE_DIR, align_many, align_stream
+from fasta import read_fasta
+from pairwise_aligner import global_align
 
-# THIS SCRIPT REQUIRES MUSCLE TO BE INSTALLED
+# THIS SCRIPT REQUIRES MUSCLE (OR MAFFT) TO BE INSTALLED, OR NUMPY FOR --aligner builtin
 
-def pairwise_alignment(fasta_file, alignment_file):
+def read_pair(fasta_file):
 	"""
-	Description: Perform a pairwise alignment using MUSCLE 
-	Inputs: fasta_file (string) - path to fasta file (used as input file for MUSCLE)
-			alignment_file (string) - path to alignment fasta file (used as output file for MUSCLE)
+	Description: Read in the two alleles to align
+	Inputs: fasta_file (string) - path to fasta file with the two alleles
+	Return: names (list of strings) - headers from fasta file
+			seqs (list of strings) - sequences from fasta file
 	"""
-	os.system(f"muscle -align {fasta_file} -output {alignment_file}")
+	names, seqs = read_fasta(fasta_file)
+	if len(seqs) != 2:
+		raise ValueError(f"{fasta_file} has {len(seqs)} sequences, expected 2")
+	return names, seqs
 
-def read_fasta(fasta_file):
+def write_alignment(alignment_file, names, alignments):
 	"""
-	Description: Read in sequences from fasta file 
-	Inputs: fasta_file (string) - path to fasta file 
-	Return: seqs (list of strings) - sequences from fasta file
+	Description: Write a pairwise alignment to a fasta file
+	Inputs: alignment_file (string) - path to alignment fasta file
+			names (list of strings) - headers of the two alleles
+			alignments (list of strings) - the two aligned sequences
 	"""
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
-	
-	return seqs
+	with open(alignment_file, "w") as file:
+		for name, seq in zip(names, alignments):
+			file.write(f">{name}\n{seq}\n")
+
+def builtin_alignment(job, gap_open=11, gap_extend=1, band=100):
+	"""
+	Description: Perform a pairwise alignment in-process with pairwise_aligner.py (BLOSUM62, affine gap penalties)
+	Inputs: job (tuple) - (path to fasta file with the two alleles, path to write the alignment fasta file to or None)
+			gap_open, gap_extend, band - see pairwise_aligner.global_align
+	Return: alignments (list of strings) - the two aligned sequences, None if the alignment failed
+			error (exception) - None if the alignment succeeded
+	"""
+	fasta_file, alignment_file = job
+	try:
+		names, seqs = read_pair(fasta_file)
+		aligned1, aligned2, score = global_align(seqs[0], seqs[1], gap_open=gap_open, gap_extend=gap_extend, band=band)
+		if alignment_file is not None:
+			write_alignment(alignment_file, names, [aligned1, aligned2])
+	except (OSError, ValueError) as error:
+		return None, error
+	return [aligned1, aligned2], None
+
+def stream_alignment(job, aligner="muscle", executable=None, timeout=None):
+	"""
+	Description: Perform a pairwise alignment by piping the alleles through MUSCLE (or MAFFT), without intermediate files
+	Inputs: job (tuple) - (path to fasta file with the two alleles, path to write the alignment fasta file to or None)
+			aligner, executable, timeout - see aligner.align_stream
+	Return: alignments (list of strings) - the two aligned sequences, None if the alignment failed
+			error (exception) - None if the alignment succeeded
+	"""
+	fasta_file, alignment_file = job
+	try:
+		names, seqs = read_pair(fasta_file)
+		alignments = align_stream(list(zip(names, seqs)), aligner, executable, timeout)
+		if alignment_file is not None:
+			write_alignment(alignment_file, names, alignments)
+	except (OSError, ValueError, RuntimeError) as error:
+		return None, error
+	return alignments, None
 
 def get_indels(seq1, seq2):
 	"""
@@ -183,21 +221,79 @@ def output_coords(coords, csv_file):
 
 if __name__ == "__main__":
 	
-	# Input species code and create strings with paths to input/output files using the code
-	code = argv[1] 
-	fasta_file = "../alignments/" + code + "_both_alleles.fasta"
-	alignment_file = "../alignments/" + code + "_both_alleles_aligned.fasta"
-	csv_file = code + "_both_alleles.csv"
-	
-	# Create and read in pairwise alignment 
-	pairwise_alignment(fasta_file, alignment_file)
-	alignments = read_fasta(alignment_file)
+	parser = argparse.ArgumentParser(description="Align the two alleles of each species and calculate the coordinates of each indel")
+	parser.add_argument("codes", nargs="+", help="species codes, the input files are <alignment dir>/<code>_both_alleles.fasta")
+	parser.add_argument("--aligner", choices=sorted(ALIGNERS) + ["builtin"], default="muscle",
+					help="aligner to use, builtin aligns in-process without an external aligner (default: muscle)")
+	parser.add_argument("--executable", help="path to the aligner executable (default: the aligner on the PATH)")
+	parser.add_argument("--workers", type=int, default=4, help="number of alignments to run at the same time (default: 4)")
+	parser.add_argument("--timeout", type=float, help="seconds to wait for each alignment (default: no limit)")
+	parser.add_argument("--alignment-dir", default="../alignments", help="directory of input and aligned fasta files (default: ../alignments)")
+	parser.add_argument("--output-dir", default=".", help="directory to write the coordinate csv files to (default: current directory)")
+	parser.add_argument("--pipeline", action="store_true",
+					help="pipe the alleles through the aligner and calculate the indels in memory, writing only the csv files")
+	parser.add_argument("--keep-alignment", action="store_true", help="with --pipeline or --aligner builtin, also write the aligned fasta files")
+	parser.add_argument("--cache-dir", help=f"directory of cached alignments (default: {DEFAULT_CACHE_DIR})")
+	parser.add_argument("--no-cache", action="store_true", help="always run the aligner")
+	parser.add_argument("--gap-open", type=int, default=11, help="builtin aligner: penalty of the first residue of a gap (default: 11)")
+	parser.add_argument("--gap-extend", type=int, default=1, help="builtin aligner: penalty of every further residue of a gap (default: 1)")
+	parser.add_argument("--band", type=int, default=100, help="builtin aligner: starting band width in diagonals, widened as needed (default: 100)")
+	args = parser.parse_args()
+	if args.aligner == "builtin":
+		ignored = [option for option, given in [("--executable", args.executable is not None), ("--timeout", args.timeout is not None),
+					("--cache-dir", args.cache_dir is not None), ("--no-cache", args.no_cache), ("--pipeline", args.pipeline)] if given]
+		if ignored:
+			parser.error(f"{', '.join(ignored)} cannot be used with --aligner builtin")
+	cache_dir = None if args.no_cache else (args.cache_dir or DEFAULT_CACHE_DIR)
+	in_memory = args.pipeline or args.aligner == "builtin"
+	os.makedirs(args.output_dir, exist_ok=True)
+
+	# Create strings with paths to input/output files using each code (MAFFT and builtin outputs get a suffix). In
+	# memory, the alignment is only written if it is kept.
+	suffix = "" if args.aligner == "muscle" else "_" + args.aligner
+	jobs = []
+	for code in args.codes:
+		fasta_file = os.path.join(args.alignment_dir, code + "_both_alleles.fasta")
+		alignment_file = os.path.join(args.alignment_dir, code + "_both_alleles" + suffix + "_aligned.fasta")
+		if in_memory and not args.keep_alignment:
+			alignment_file = None
+		jobs.append((fasta_file, alignment_file))
+
+	# Create the pairwise alignments, several at a time
+	if args.aligner == "builtin":
+		run = partial(builtin_alignment, gap_open=args.gap_open, gap_extend=args.gap_extend, band=args.band)
+		if args.workers > 1 and len(jobs) > 1:
+			with Pool(args.workers) as pool:
+				results = list(pool.imap(run, jobs))
+		else:
+			results = [run(job) for job in jobs]
+	elif args.pipeline:
+		run = partial(stream_alignment, aligner=args.aligner, executable=args.executable, timeout=args.timeout)
+		with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+			results = list(pool.map(run, jobs))
+	else:
+		errors = align_many(jobs, args.aligner, args.executable, args.workers, args.timeout, cache_dir)
+		results = [(None, error) for error in errors]
+
+	failed = 0
+	for code, (fasta_file, alignment_file), (alignments, error) in zip(args.codes, jobs, results):
+		if error is not None:
+			print(f"{code}: {error}", file=sys.stderr)
+			failed += 1
+			continue
+
+		# Read in pairwise alignment (unless it was made in memory)
+		csv_file = os.path.join(args.output_dir, code + "_both_alleles" + suffix + ".csv")
+		if alignments is None:
+			names, alignments = read_fasta(alignment_file)
+
+		# Get positions of indels
+		table = get_indels(alignments[0], alignments[1])
+		table = fix_positions(table)
+		
+		# Calculate output polygon coords for plotting in R 
+		coords = get_poly_coords(table, alignments[0], alignments[1])
+		output_coords(coords, csv_file)
 
-	# Get positions of indels
-	table = get_indels(alignments[0], alignments[1])
-	table = fix_positions(table)
-	
-	# Calculate output polygon coords for plotting in R 
-	coords = get_poly_coords(table, alignments[0], alignments[1])
-	output_coords(coords, csv_file)
-	
+	if failed:
+		sys.exit(f"{failed} of {len(jobs)} alignments failed")
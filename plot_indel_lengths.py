@@ -1,44 +1,86 @@
+import argparse
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator, NullLocator
 import numpy as np
-from sys import argv
-
-# THIS SCRIPT REQUIRES MATPLOTLIB
-
-max_len = 100
-
-lengths = []
-
-# csv_file from running pull_indels.py
-csv_file = argv[1]
-output_pdf = argv[2]
-
-with open(csv_file) as file:
-    file.readline()
-    for line in file:
-        items = line.strip().split(",")
-        if len(items) == 1:
-            break
-        
-        lengths.append(int(items[5]))
-        
-all_counts = []
-for i in range(1,max_len+1):
-    all_counts.append(lengths.count(i))
-
-width = 0.5
-
-fig, ax = plt.subplots()
-fig.set_size_inches(8,3)
-bottom = np.zeros(max_len)
-ax.bar(list(range(1,max_len+1)), all_counts, width, bottom=bottom, color="#020080")
-ax.set_xlabel("Indel Length (Amino Acids)", size=12)
-ax.set_ylabel("Count", size=12)
-ax.tick_params(axis='both', which='major', labelsize=10)
-ax.xaxis.set_major_locator(MultipleLocator(5))
-ax.xaxis.set_minor_locator(NullLocator())
-ax.yaxis.set_major_locator(MultipleLocator(10))
-ax.yaxis.set_minor_locator(MultipleLocator(5))
-ax.margins(x=0.01)
-ax.spines[['right', 'top']].set_visible(False)
-plt.savefig(output_pdf,format='pdf',dpi=1200,bbox_inches='tight', pad_inches=0.25)
+from indel_histogram import histograms, make_bins, output_histograms, read_indel_table
+
+# THIS SCRIPT REQUIRES MATPLOTLIB AND NUMPY
+
+TITLES = {"full": "Full Length", "amino": "Amino Acid Length"}
+
+def plot_panel(ax, edges, counts, unit_bins, log_bins, title=None, default_ticks=True):
+    """
+    Description: Plot one length histogram
+    Inputs: ax (matplotlib axes)
+            edges (numpy int array) - bin edges, from make_bins
+            counts (numpy int array) - count in each bin
+            unit_bins (bool) - True if every bin is one length wide (drawn as thin bars at each length)
+            log_bins (bool) - True to draw the length axis on a log scale
+            title (string) - title of the panel, None for no title
+            default_ticks (bool) - True to use the tick spacing of the single histogram figure
+    """
+    if unit_bins:
+        bottom = np.zeros(len(counts))
+        ax.bar(edges[:-1].tolist(), counts.tolist(), 0.5, bottom=bottom, color="#020080")
+    else:
+        ax.bar(edges[:-1].tolist(), counts.tolist(), np.diff(edges) * 0.8, align="edge", color="#020080")
+    ax.set_xlabel("Indel Length (Amino Acids)", size=12)
+    ax.set_ylabel("Count", size=12)
+    ax.tick_params(axis='both', which='major', labelsize=10)
+    if log_bins:
+        ax.set_xscale("log")
+    elif default_ticks:
+        ax.xaxis.set_major_locator(MultipleLocator(5))
+        ax.xaxis.set_minor_locator(NullLocator())
+    if default_ticks:
+        ax.yaxis.set_major_locator(MultipleLocator(10))
+        ax.yaxis.set_minor_locator(MultipleLocator(5))
+    if title is not None:
+        ax.set_title(title, loc="left", size=12)
+    ax.margins(x=0.01)
+    ax.spines[['right', 'top']].set_visible(False)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Plot histograms of the indel lengths from pull_indels.py")
+    # csv_file from running pull_indels.py
+    parser.add_argument("csv_file")
+    parser.add_argument("output_pdf")
+    parser.add_argument("--lengths", nargs="+", choices=["full", "amino"], default=["full"],
+                        help="lengths to plot, one column of panels each (default: full)")
+    parser.add_argument("--by", nargs="+", choices=["all", "population", "individual"], default=["all"],
+                        help="panels for all indels, each population and/or each individual (default: all)")
+    parser.add_argument("--max-len", type=int, default=100, help="longest indel length counted (default: 100)")
+    parser.add_argument("--bin-width", type=int, default=1, help="lengths per bin (default: 1)")
+    parser.add_argument("--log-bins", type=int, metavar="N", help="use N logarithmically spaced bins instead")
+    parser.add_argument("--counts", metavar="CSV_FILE", help="also write the histograms to CSV_FILE")
+    args = parser.parse_args()
+    if args.max_len < 1 or args.bin_width < 1 or (args.log_bins is not None and args.log_bins < 1):
+        parser.error("--max-len, --bin-width and --log-bins must be at least 1")
+
+    # Read the table once and count every histogram from it
+    edges = make_bins(args.max_len, args.bin_width, args.log_bins)
+    counts = histograms(read_indel_table(args.csv_file), edges)
+    if args.counts:
+        output_histograms(args.counts, counts, edges)
+
+    # One row of panels per group, one column per length
+    panels = [(grouping, group) for grouping in args.by for group in counts[(args.lengths[0], grouping)]]
+    single = len(panels) == 1 and len(args.lengths) == 1
+    unit_bins = args.log_bins is None and args.bin_width == 1
+
+    fig, axes = plt.subplots(len(panels), len(args.lengths), squeeze=False)
+    fig.set_size_inches(8 * len(args.lengths), 3 * len(panels))
+    for row, (grouping, group) in enumerate(panels):
+        for column, length in enumerate(args.lengths):
+            if single:
+                title = None
+            elif grouping == "all":
+                title = f"All indels, {TITLES[length]}"
+            else:
+                title = f"{grouping.capitalize()} {group}, {TITLES[length]}"
+            plot_panel(axes[row][column], edges, counts[(length, grouping)][group], unit_bins, args.log_bins is not None,
+                       title, default_ticks=single and unit_bins)
+    if not single:
+        fig.tight_layout()
+    plt.savefig(args.output_pdf,format='pdf',dpi=1200,bbox_inches='tight', pad_inches=0.25)
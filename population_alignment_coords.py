@@ -1,5 +1,13 @@
-from sys import argv
+import argparse
 import os
+from multiprocessing import Pool
+import numpy as np
+from alignment_cache import load_alignment
+from samples import DEFAULT_SAMPLE_SHEET, check_alleles, get_population, read_sample_sheet
+
+# THIS SCRIPT REQUIRES NUMPY
+
+GAP = ord("-")
 
 def read_fasta(fasta_file, gene):
 	"""
@@ -7,178 +15,226 @@ def read_fasta(fasta_file, gene):
 	Inputs: fasta_file (string) - path to fasta file
 			gene (string) 
 	Return: names (list of strings) - headers from fasta file
-			seqs (list of strings) - sequences from fasta file (in the same order as names)
-	"""
-	names = []
-	seqs = []
-	seq = ""
-	with open(fasta_file) as file:
-		for line in file:
-			if line.startswith(">"):
-				if gene == "resilin":
-					names.append(line[7:-11]+line[-2])
-				else:
-					names.append(line[1:-1])
-				if seq != "":
-					seqs.append(seq)
-				seq = ""
-			else:
-				seq += line.strip()
-		seqs.append(seq)
+			matrix (numpy uint8 array) - alignment residue matrix (rows in the same order as names)
+	"""
+	names, matrix = load_alignment(fasta_file)
+	if gene == "resilin":
+		names = [name[6:-10] + name[-1] for name in names]
 
-	return names, seqs
+	return names, matrix
 
-def remove_common_gaps(seq1, seq2):
+def pair_columns(gaps, rows1, rows2):
 	"""
-	Description: Remove gaps shared between two sequences (resulting in a pairwise alignment)
-	Inputs: seq1 (string) 
-			seq2 (string)
-	Return: new1 (string) - seq1 with shared gaps removed
-			new2 (string) - seq2 with shared gaps removed
+	Description: Remove the gaps shared between each pair of sequences (resulting in their pairwise alignments), for 
+				every pair at once
+	Inputs: gaps (numpy bool array) - True where the alignment has a gap
+			rows1, rows2 (numpy int arrays) - row of the first and second sequence of each pair
+	Return: pair (numpy int array) - pair of each column kept, grouped by pair in column order
+			classes (numpy uint8 array) - for each column kept: 0 if neither sequence has a gap, 1 if the second 
+				sequence has a gap (insertion in the first) and 2 if the first sequence has a gap
+			lengths (numpy int array) - pairwise alignment length of each pair
 	"""
-	new1 = ""
-	new2 = ""
-	for i in range(len(seq1)):
-		amino1 = seq1[i]
-		amino2 = seq2[i]
+	gaps1 = gaps[rows1]
+	gaps2 = gaps[rows2]
+	keep = ~(gaps1 & gaps2)
 
-		if not (amino1 == "-" and amino2 == "-"):
-			new1 += amino1
-			new2 += amino2
+	pair = np.nonzero(keep)[0]
+	classes = gaps2[keep].astype(np.uint8) + 2 * gaps1[keep].astype(np.uint8)
+	lengths = keep.sum(axis=1)
+	return pair, classes, lengths
 
-	return new1, new2
-
-def get_indels(seq1, seq2):
+def gap_runs(pair, classes):
 	"""
-	Description: Pull indels from pairwise alignment
-	Inputs: seq1 (string)
-			seq2 (string)
-	Return: table (list of lists of strings) - table of indel data with columns: allele (with insert), start position, indel length
+	Description: Find the runs of gap columns in the pairwise alignments, i.e. every indel before the plotting rules of
+				get_indels are applied
+	Inputs: pair, classes (numpy arrays) - result of pair_columns
+	Return: run_starts, run_stops (numpy int arrays) - first and one past the last column of each run of columns with
+				the same gap class within a pair, in column order
 	"""
-	inGap = False
-	table = []
-
-	# Loop over each position in the alignment
-	for i in range(len(seq1)):
-
-		# Pull amino acid for given position in each seq
-		amino1 = seq1[i]
-		amino2 = seq2[i]
-
-		if (amino1 == "-" or amino2 == "-") and inGap == False:
-			# This would be the start of a gap 
-
-			inGap = True
-			row = []
-
-			# Add which allele has the insertion 
-			if amino1 == "-":
-				allele = "2"
-				row.append(allele)
-			else:
-				allele = "1"
-				row.append(allele)
-
-			# Add the start position
-			start = i
-			row.append(str(i))
-
-		if inGap == True and ((allele == "1" and amino2 != "-") or (allele == "2" and amino1 != "-")):
-			# This would be the end of a gap
-
-			inGap = False
-
-			# Pull the insertion from the sequence
-			if allele == "1":
-				insertion = seq1[start:i]
-			else:
-				insertion = seq2[start:i]
-
-			# Add the length of the insertion
-			row.append(str(len(insertion)))
-			table.append(row)
-	
-	return table
-
-def fix_positions(table):
+	boundary = np.ones(len(pair), dtype=bool)
+	boundary[1:] = (pair[1:] != pair[:-1]) | (classes[1:] != classes[:-1])
+	run_starts = np.flatnonzero(boundary)
+	run_stops = np.append(run_starts[1:], len(pair))
+	gapped = classes[run_starts] != 0
+	return run_starts[gapped], run_stops[gapped]
+
+def get_indels(pair, classes, lengths):
 	"""
-	Description: Adjust the values in the table so that indel start positions are in relation to the unaligned sequences
-	Inputs: table (list of lists of strings) - table of indel data with columns: allele (with insert), start position, indel length
-	Return: table (list of lists of strings) - table of indel data with adjusted start positions (same columns)
+	Description: Pull indels from the pairwise alignments. A gap that starts right where the previous gap ends (in the 
+				other sequence) is taken to start one position later, and is skipped if that leaves it empty; a gap 
+				still open at the end of the alignment is skipped.
+	Inputs: pair, classes, lengths (numpy arrays) - result of pair_columns
+	Return: indels (dictionary of numpy int arrays) - pair, allele (with insert), start position and indel length 
+				of each indel, grouped by pair in position order
 	"""
+	# Position of each column in its pairwise alignment
+	pair_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+	positions = np.arange(len(pair)) - pair_starts[pair]
+
+	# Runs of columns with the same class within a pair
+	run_starts, run_stops = gap_runs(pair, classes)
+
+	run_pair = pair[run_starts]
+	allele = classes[run_starts].astype(np.int64)
+	start = positions[run_starts]
+	stop = start + (run_stops - run_starts)
+
+	# A gap starting right where the previous one ends is only seen one column later (the column is spent 
+	# ending the previous gap). If that was its only column it is never opened, and the gap after it 
+	# starts normally again, so within a chain of one column gaps every other gap is opened.
+	adjacent = np.zeros(len(start), dtype=bool)
+	adjacent[1:] = (run_pair[1:] == run_pair[:-1]) & (start[1:] == stop[:-1])
+	single = adjacent & (stop - start == 1)
+	indices = np.arange(len(start))
+	chain_start = np.maximum.accumulate(np.where(single, 0, indices))
+	opened = (indices - chain_start) % 2 == 0
+
+	delayed = np.zeros(len(start), dtype=bool)
+	delayed[1:] = adjacent[1:] & opened[:-1]
+	start = start + delayed
+
+	# Gaps still open at the end of the alignment are never closed
+	recorded = opened & (stop < lengths[run_pair])
+	return {"pair": run_pair[recorded], "allele": allele[recorded], "position": start[recorded], 
+			"length": (stop - start)[recorded]}
+
+def group_cumsum(values, groups):
+	"""
+	Description: Sum of the values before each one within its group
+	Inputs: values (numpy int array)
+			groups (numpy int array) - group of each value, with each group's values next to each other
+	Return: sums (numpy int array) - exclusive cumulative sum of values within each group
+	"""
+	sums = np.cumsum(values) - values
+	first = np.ones(len(groups), dtype=bool)
+	first[1:] = groups[1:] != groups[:-1]
+	return sums - sums[first][np.cumsum(first) - 1]
 
-	offset1 = 0
-	offset2 = 0
-
-	for i, row in enumerate(table):
-		allele = row[0]
-		position = int(row[1])
-		length = int(row[2])
-
-		if allele == "1":
-			row[1] = position - offset1
-			table[i] = row
-			offset1 += length
-
+def fix_positions(indels):
+	"""
+	Description: Adjust the indel start positions so that they are in relation to the unaligned sequences
+	Inputs: indels (dictionary of numpy int arrays) - result of get_indels
+	Return: indels (dictionary of numpy int arrays) - same columns with adjusted start positions
+	"""
+	# Subtract the lengths of the earlier insertions in the same sequence
+	offset = np.zeros(len(indels["position"]), dtype=np.int64)
+	for allele in [1, 2]:
+		mine = indels["allele"] == allele
+		offset[mine] = group_cumsum(indels["length"][mine], indels["pair"][mine])
 
-		else:
-			row[1] = position - offset2
-			table[i] = row
-			offset2 += length
-	return table
+	fixed = dict(indels)
+	fixed["position"] = indels["position"] - offset
+	return fixed
 
-def get_poly_coords(table, seq1, seq2):
+def get_poly_coords(indels, lengths, residues1, residues2):
 	"""
 	Description: Calculate the coordinates of polygons based on indel positions (the grey boxes in the end figure)
-	Inputs: table (list of lists of strings) - table of indel data with columns: allele (with insert), start position, indel length
-			seq1 (string) - first sequence in the alignment
-			seq2 (string) - second sequence in the alignment
-	Return: coords (list of lists of strings) - table of coordinates of polygons with columns: top_left, top_right, bottom_left, bottom_right
+	Inputs: indels (dictionary of numpy int arrays) - result of fix_positions
+			lengths (numpy int array) - pairwise alignment length of each pair
+			residues1, residues2 (numpy int arrays) - number of residues in the first and second sequence of each pair
+	Return: coords (list of lists of lists of strings) - for each pair, table of coordinates of polygons with columns: 
+				top_left, top_right, bottom_left, bottom_right
 	"""
-	if table == []:
-	  return [["0",str(len(seq1)),"0",str(len(seq2))]]
+	pair = indels["pair"]
+	is1 = indels["allele"] == 1
+	position = indels["position"]
+	length = indels["length"]
+
+	# Running shift between the two sequences before each indel
+	offset = group_cumsum(np.where(is1, -length, length), pair)
+	top = np.where(is1, position - offset, position)
+	bottom = np.where(is1, position, position + offset)
+	top_after = top + np.where(is1, length, 0)
+	bottom_after = bottom + np.where(is1, 0, length)
+
+	# Each polygon runs from the end of the previous indel to the start of this one
+	first = np.ones(len(pair), dtype=bool)
+	first[1:] = pair[1:] != pair[:-1]
+	prev_top = np.where(first, 0, np.roll(top_after, 1))
+	prev_bottom = np.where(first, 0, np.roll(bottom_after, 1))
+	rows = np.stack([prev_top, top, prev_bottom, bottom], axis=1).astype(str).tolist()
 
 	coords = []
+	bounds = np.searchsorted(pair, np.arange(len(lengths) + 1))
+	for i in range(len(lengths)):
+		start, stop = bounds[i], bounds[i+1]
+		if start == stop:
+			coords.append([["0", str(lengths[i]), "0", str(lengths[i])]])
+			continue
+		last_row = [str(top_after[stop-1]), str(residues1[i]), str(bottom_after[stop-1]), str(residues2[i])]
+		coords.append(rows[start:stop] + [last_row])
+	return coords
 
-	prev_top = 0
-	prev_bottom = 0
-	prev_length = 0
-
-	offset = 0
-
-	for row in table:
-		allele = row[0]
-		position = int(row[1])
-		length = int(row[2])
-
-		if allele == "1":
-			top = position - offset
-			bottom = position
-
-		else:
-			top = position
-			bottom = position + offset
-
-		new_row = [str(prev_top), str(top), str(prev_bottom), str(bottom)]
-		coords.append(new_row)
-
-		if allele == "1":
-			offset -= length
-			top += length
-
-		else:
-			offset += length
-			bottom += length
-
-		prev_top = top
-		prev_bottom = bottom
-		prev_length = length
-
-	last_row = [str(top), str(len(seq1.replace("-",""))), str(bottom), str(len(seq2.replace("-","")))]
-	coords.append(last_row)
+def compare_pairs(matrix, gaps, rows1, rows2):
+	"""
+	Description: Calculate the polygon coordinates and summary stats of the pairwise alignments of many pairs of 
+				sequences in one batch
+	Inputs: matrix (numpy uint8 array) - alignment residue matrix
+			gaps (numpy bool array) - True where the alignment has a gap (computed once for the whole alignment)
+			rows1, rows2 (numpy int arrays) - row of the first and second sequence of each pair
+	Return: coords (list of lists of lists of strings) - result of get_poly_coords for each pair
+			stats (list of tuples) - (number of indels, total indel length, percent identity) of each pair, where the
+				indels are every run of gap columns in the pairwise alignment (as distance_matrix.py counts them, not
+				just the ones plotted) and percent identity is the percent of pairwise alignment columns with the same
+				residue in both sequences
+	"""
+	rows1 = np.asarray(rows1, dtype=np.int64)
+	rows2 = np.asarray(rows2, dtype=np.int64)
+	residues = (~gaps[np.concatenate([rows1, rows2])]).sum(axis=1)
+
+	pair, classes, lengths = pair_columns(gaps, rows1, rows2)
+	indels = fix_positions(get_indels(pair, classes, lengths))
+	coords = get_poly_coords(indels, lengths, residues[:len(rows1)], residues[len(rows1):])
+
+	# Stats count every gap run, including the ones get_indels leaves out of the plot
+	run_starts, run_stops = gap_runs(pair, classes)
+	counts = np.bincount(pair[run_starts], minlength=len(rows1))
+	total = np.bincount(pair[run_starts], weights=run_stops - run_starts, minlength=len(rows1)).astype(np.int64)
+	matches = ((matrix[rows1] == matrix[rows2]) & ~gaps[rows1]).sum(axis=1)
+	stats = []
+	for count, length, match, size in zip(counts.tolist(), total.tolist(), matches.tolist(), lengths.tolist()):
+		stats.append((count, length, round(match/size*100, 2) if size else 0.0))
+	return coords, stats
+
+def init_worker(matrix):
+	"""
+	Description: Set up a worker process with the alignment matrix (and its gaps) to compare pairs from
+	Inputs: matrix (numpy uint8 array) - alignment residue matrix
+	"""
+	global worker_matrix, worker_gaps
+	worker_matrix = matrix
+	worker_gaps = matrix == GAP
 
-	return coords
+def compare_chunk(chunk):
+	"""
+	Description: Compare a chunk of pairs in a worker process
+	Inputs: chunk (tuple) - rows of the first and second sequence of each pair
+	Return: result of compare_pairs for the chunk
+	"""
+	rows1, rows2 = chunk
+	return compare_pairs(worker_matrix, worker_gaps, rows1, rows2)
 
+def iter_pairs(matrix, rows1, rows2, workers=1, chunk_size=64):
+	"""
+	Description: Compare every pair in chunks (to bound memory), in a pool of worker processes if workers > 1
+	Inputs: matrix (numpy uint8 array) - alignment residue matrix
+			rows1, rows2 (lists of ints) - row of the first and second sequence of each pair
+			workers (int) - number of processes to use
+			chunk_size (int) - number of pairs compared in one batch
+	Return: generator of tuples - (coords, stats) of each pair, in the same order as the pairs
+	"""
+	matrix = np.asarray(matrix)
+	chunks = [(rows1[i:i+chunk_size], rows2[i:i+chunk_size]) for i in range(0, len(rows1), chunk_size)]
+	if workers <= 1:
+		gaps = matrix == GAP
+		results = (compare_pairs(matrix, gaps, chunk_rows1, chunk_rows2) for chunk_rows1, chunk_rows2 in chunks)
+		for coords, stats in results:
+			yield from zip(coords, stats)
+		return
+
+	with Pool(workers, initializer=init_worker, initargs=(matrix,)) as pool:
+		for coords, stats in pool.imap(compare_chunk, chunks):
+			yield from zip(coords, stats)
 
 def output_coords(coords, csv_file):
 	"""
@@ -195,48 +251,157 @@ def output_coords(coords, csv_file):
 			line = ",".join(row) + "\n"
 			file.write(line)
 
-if __name__ == "__main__":
-
-	# Input alignment file and gene, read in alignment data
-	alignment_file = argv[1]
-	gene = argv[2]
-	names, alignments = read_fasta(alignment_file, gene)
-
-	order = ['1_1', '1_2', '2_1', '2_2', '3_1', '3_2', '4_1', '4_2', '5_1', '5_2', '6_1', '6_2', '7_1', 
-          	 '7_2', '8_1', '8_2', '9_1', '9_2', '10_1', '10_2', '11_1', '11_2', '12_1', '12_2', '13_1', 
-          	 '13_2', '14_1', '14_2', '15_1', '15_2', '16_1', '16_2', '17_1', '17_2', '18_1', '18_2']
-
-	if gene == "resilin":
-		order_old = order
-		order = []
-		for i in ["A","B"]:
-			for j in order_old:
-				order.append(j+i)
-	else:
-		order_old = order
-		order = []
-		for i in order_old:
-			if i in names:
-				order.append(i)
-
-	# Loop over each pair of sequences in population alignment
-	for i in range(len(order)-1):
+def write_combined(output_file, output_format, named_coords, batch_size=65536):
+	"""
+	Description: Output the polygon coordinates of every pair to a single long format file (pair columns then X1..X4)
+	Inputs: output_file (string) - path to output file
+			output_format (string) - csv or parquet
+			named_coords (iterable of tuples) - (name of first sequence, name of second sequence, coords) of each pair
+			batch_size (int) - number of rows written at a time
+	"""
+	if output_format == "csv":
+		with open(output_file, "w", buffering=1 << 20) as file:
+			file.write("Allele1,Allele2,X1,X2,X3,X4\n")
+			lines = []
+			for name1, name2, coords in named_coords:
+				prefix = f"{name1},{name2},"
+				lines += [prefix + ",".join(row) + "\n" for row in coords]
+				if len(lines) >= batch_size:
+					file.write("".join(lines))
+					lines = []
+			file.write("".join(lines))
+		return
+
+	try:
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+	except ImportError:
+		raise ImportError("Writing parquet files requires pyarrow (pip install pyarrow)")
+
+	schema = pa.schema([("Allele1", pa.string()), ("Allele2", pa.string()), ("X1", pa.int64()), ("X2", pa.int64()), 
+				("X3", pa.int64()), ("X4", pa.int64())])
+
+	def batch(columns):
+		arrays = [pa.array(columns[0], pa.string()), pa.array(columns[1], pa.string())]
+		arrays += [pa.array(np.array(column, dtype=np.int64)) for column in columns[2:]]
+		return pa.record_batch(arrays, schema=schema)
+
+	with pq.ParquetWriter(output_file, schema, compression="zstd", use_dictionary=["Allele1", "Allele2"]) as writer:
+		columns = [[] for _ in range(6)]
+		for name1, name2, coords in named_coords:
+			columns[0] += [name1] * len(coords)
+			columns[1] += [name2] * len(coords)
+			for k in range(4):
+				columns[k+2] += [int(row[k]) for row in coords]
+			if len(columns[0]) >= batch_size:
+				writer.write_batch(batch(columns))
+				columns = [[] for _ in range(6)]
+		writer.write_batch(batch(columns))
+
+def name_pairs(names, pairs, results, stats_rows):
+	"""
+	Description: Attach the sequence names to the results of iter_pairs, collecting the summary stats as they go by
+	Inputs: names (list of strings) - headers from fasta file
+			pairs (list of tuples) - rows of the first and second sequence of each pair
+			results (iterable of tuples) - result of iter_pairs for the pairs
+			stats_rows (list) - (name1, name2, number of indels, total indel length, percent identity) of each pair 
+				is appended to it
+	Return: generator of tuples - (name of first sequence, name of second sequence, coords) of each pair
+	"""
+	for (i, j), (coords, stats) in zip(pairs, results):
+		stats_rows.append((names[i], names[j]) + tuple(stats))
+		yield names[i], names[j], coords
 
-		name1 = order[i]
-		name2 = order[i+1]
+def output_stats(stats_file, stats_rows, samples):
+	"""
+	Description: Output the summary stats of each pair to a csv file
+	Inputs: stats_file (string) - path to csv file to output to
+			stats_rows (list of tuples) - from name_pairs
+			samples (dictionary) - sample sheet from read_sample_sheet
+	"""
+	with open(stats_file, "w") as file:
+		file.write("Allele1,Allele2,Population1,Population2,Indels,Indel Length,Identity\n")
+		for name1, name2, count, length, identity in stats_rows:
+			pop1 = get_population(samples, name1)
+			pop2 = get_population(samples, name2)
+			file.write(f"{name1},{name2},{pop1},{pop2},{count},{length},{identity}\n")
 
-		seq1 = alignments[names.index(name1)]
-		seq2 = alignments[names.index(name2)]
+if __name__ == "__main__":
 
-		# Path to csv file for coords of pairwise alignment between two given sequences
-		csv_file = gene + "/" + name1 + "vs" + name2 + "coords.csv"
+	parser = argparse.ArgumentParser(description="Calculate the coordinates of each indel in pairs of sequences from a multiple sequence alignment")
+	parser.add_argument("alignment_file")
+	parser.add_argument("gene", help="gene name, also the directory the coords csv files are written to")
+	parser.add_argument("--all-pairs", action="store_true", help="compare every sequence with every other sequence instead of neighbours in order")
+	parser.add_argument("--order", help="file with the sequence names to compare in order, one per line (e.g. from distance_matrix.py --order-file)")
+	parser.add_argument("--stats", help="csv file to write the summary stats of each pair to (default with --all-pairs: <gene>_pair_stats.csv)")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes to compare pairs with (default: 1)")
+	parser.add_argument("--output", help="write the coords of every pair to this single file instead of a csv file per pair")
+	parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="format of the --output file (default: csv)")
+	parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+	args = parser.parse_args()
 
-		# Remove common gaps and get positions of indels
-		new1, new2 = remove_common_gaps(seq1, seq2)
-		table = fix_positions(get_indels(new1, new2))
-		
-		# Calculate output polygon coords for plotting in R 
-		coords = get_poly_coords(table, new1, new2)
-		output_coords(coords, csv_file)
+	# Input alignment file and gene, read in alignment data
+	alignment_file = args.alignment_file
+	gene = args.gene
+	names, matrix = read_fasta(alignment_file, gene)
+
+	if args.all_pairs:
+		# Every sequence against every later sequence, in alignment order
+		pairs = [(i, j) for i in range(len(names)) for j in range(i+1, len(names))]
+	elif args.order:
+		with open(args.order) as file:
+			order = [line.strip() for line in file if line.strip() in names]
+
+		# Each pair of neighbouring sequences in order
+		row = {name: i for i, name in enumerate(names)}
+		pairs = [(row[order[i]], row[order[i+1]]) for i in range(len(order)-1)]
+	else:
+		order = ['1_1', '1_2', '2_1', '2_2', '3_1', '3_2', '4_1', '4_2', '5_1', '5_2', '6_1', '6_2', '7_1', 
+          		 '7_2', '8_1', '8_2', '9_1', '9_2', '10_1', '10_2', '11_1', '11_2', '12_1', '12_2', '13_1', 
+          		 '13_2', '14_1', '14_2', '15_1', '15_2', '16_1', '16_2', '17_1', '17_2', '18_1', '18_2']
+
+		if gene == "resilin":
+			order_old = order
+			order = []
+			for i in ["A","B"]:
+				for j in order_old:
+					order.append(j+i)
+		else:
+			order_old = order
+			order = []
+			for i in order_old:
+				if i in names:
+					order.append(i)
+
+		# Each pair of neighbouring sequences in order
+		row = {name: i for i, name in enumerate(names)}
+		pairs = [(row[order[i]], row[order[i+1]]) for i in range(len(order)-1)]
+
+	stats_file = args.stats or (f"{gene}_pair_stats.csv" if args.all_pairs else None)
+	samples = None
+	if stats_file:
+		# Check the alleles of every pair before comparing any of them
+		try:
+			samples = read_sample_sheet(args.samples)
+			check_alleles(samples, sorted({names[k] for pair in pairs for k in pair}), args.samples)
+		except ValueError as error:
+			parser.error(str(error))
+	stats_rows = []
+
+	# Calculate output polygon coords for plotting in R, comparing the pairs in batches
+	results = iter_pairs(matrix, [i for i, j in pairs], [j for i, j in pairs], args.workers)
+	named_coords = name_pairs(names, pairs, results, stats_rows)
+	if args.output:
+		if os.path.dirname(args.output):
+			os.makedirs(os.path.dirname(args.output), exist_ok=True)
+		write_combined(args.output, args.format, named_coords)
+	else:
+		os.makedirs(gene, exist_ok=True)
+		for name1, name2, coords in named_coords:
 
+			# Path to csv file for coords of pairwise alignment between two given sequences
+			csv_file = gene + "/" + name1 + "vs" + name2 + "coords.csv"
+			output_coords(coords, csv_file)
 
+	if stats_file:
+		output_stats(stats_file, stats_rows, samples)
@@ -1,165 +1,303 @@
-from sys import argv
+import argparse
+import hashlib
+import json
 import random
 import os
+from multiprocessing import Pool
+import numpy as np
+from alignment_cache import load_alignment
+from indel_catalogue import InsertionCatalogue, insertion_hash
+from samples import DEFAULT_SAMPLE_SHEET, get_population, population_order, read_sample_sheet
 
-pop1 = [1,2,3,4,5,6,7,8]
-pop2 = [9,10,11,12,13,14,15,16,17,18]
-
-def read_fasta(fasta_file):
-    """
-    Description: Read in sequences from fasta file 
-    Inputs: fasta_file (string) - path to fasta file 
-    Return: names (list of strings) - headers from fasta file
-            seqs (list of strings) - sequences from fasta file (in the same order as names)
-    """
-    names = []
-    seqs = []
-    seq = ""
-    with open(fasta_file) as file:
-        for line in file:
-            if line.startswith(">"):
-                names.append(line.strip().strip(">"))
-                if seq != "":
-                    seqs.append(seq)
-                seq = ""
-            else:
-                seq += line.strip()
-        seqs.append(seq)
-    
-    return names, seqs
+GAP = ord("-")
 
-def make_table(names, alignments):
+def gap_intervals(gaps):
     """
-    Description: Make a table of indel data
-    Inputs: names (list of strings) - headers from fasta file
-            alignments (list of strings) - sequences from the alignment file (in the same order as names)
-    Return: table (list of lists of strings) - table with indel positions and lengths with 
-                columns: population,individual,allele,position,ID,full length,amino acid length
-            insertion_ID_count (dictionary, key=insertion, value=[ID,count]) - keeps track of the ID and count for each insertion
-            ID_insertion (dictionary, key=ID, value=insertion) - for quick look up of insertion by ID
+    Description: Find the start and stop positions of every gap in every sequence of the alignment in one pass
+    Inputs: gaps (numpy bool array, shape (number of seqs, alignment length)) - True where the alignment has a gap
+    Return: intervals (list of tuples) - distinct (start, stop) positions of gaps, in the order they are first found 
+                going through the sequences in order (gaps running to the end of a sequence are not included)
     """
-    
-    table = []   
-    next_ID = 0
-    insertion_ID_count = {}
-    ID_insertion = {}
-    checked = []
-
-    for index in range(len(names)):
-        # Set reference sequence
-        ref = alignments[index]
+    rows, length = gaps.shape
+    padded = np.zeros((rows, length + 2), dtype=bool)
+    padded[:, 1:-1] = gaps
 
-        inGap = False
+    # Every gap adds a start and a stop transition, and nonzero lists them row by row in position order
+    transitions = np.nonzero(padded[:, 1:] != padded[:, :-1])[1]
+    starts = transitions[0::2]
+    stops = transitions[1::2]
+    closed = stops < length
 
-        # Loop over reference sequence to identify gaps and pull indels
-        for i in range(len(ref)):
-            amino = ref[i]
+    # dict keeps the first-found order while dropping repeats
+    return list(dict.fromkeys(zip(starts[closed].tolist(), stops[closed].tolist())))
 
-            if amino == "-" and inGap == False:
-                # This is the start of a gap
-                inGap = True
-                start = i
+def pull_inserts(matrix, gaps, start, stop, rows=None):
+    """
+    Description: Pull the distinct insertions found at given start and stop positions
+    Inputs: matrix (numpy uint8 array) - alignment residue matrix
+            gaps (numpy bool array) - True where the alignment has a gap
+            start (integer) - start position of gap
+            stop (integer) - stop position of gap
+            rows (numpy int array) - indices of the sequences to look at (in increasing order), None for all sequences
+    Return: inserts (list of tuples) - (index of first sequence with the insertion, insertion with gaps) 
+                for each distinct insertion at these positions, in sequence order; sequences that are 
+                all gap here are skipped
+    """
+    if rows is None:
+        rows = np.flatnonzero(~gaps[:, start:stop].all(axis=1))
+    else:
+        rows = rows[~gaps[rows, start:stop].all(axis=1)]
+    if len(rows) == 0:
+        return []
+
+    # Find the distinct insertions in bulk by comparing each row's slice as a single value
+    block = np.ascontiguousarray(matrix[rows, start:stop])
+    keys = block.view(np.dtype((np.void, stop - start))).ravel()
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+
+    return [(int(rows[i]), block[i].tobytes().decode("ascii")) for i in first.tolist()]
+
+def init_worker(matrix):
+    """
+    Description: Set up a worker process with the alignment matrix (and its gaps) to pull insertions from
+    Inputs: matrix (numpy uint8 array) - alignment residue matrix
+    """
+    global worker_matrix, worker_gaps
+    worker_matrix = matrix
+    worker_gaps = matrix == GAP
 
-            if amino != "-" and inGap == True:
-                # This is the end of a gap
-                inGap = False
-                stop = i
-                # This skips over positions that have previously been checked 
-                # (i.e. this gap was already found in previous reference sequence)
-                if (start,stop) in checked:
-                    continue
-                
-                checked.append((start,stop))
+def pull_inserts_chunk(chunk):
+    """
+    Description: Pull the distinct insertions for a chunk of gap intervals in a worker process
+    Inputs: chunk (tuple) - (start, stop) positions of gaps and the rows to look at (see pull_inserts)
+    Return: inserts (list of lists of tuples) - result of pull_inserts for each interval (in the same order as intervals)
+    """
+    intervals, rows = chunk
+    return [pull_inserts(worker_matrix, worker_gaps, start, stop, rows) for start, stop in intervals]
 
-                # Pull indels from all other sequences 
-                next_ID, insertion_ID_count, ID_insertion = pull_inserts(index, names, alignments, start, stop, table, next_ID, insertion_ID_count, ID_insertion)
+def iter_inserts(matrix, gaps, intervals, workers, rows=None):
+    """
+    Description: Pull the distinct insertions for every gap interval, in a pool of worker processes if workers > 1
+    Inputs: matrix (numpy uint8 array) - alignment residue matrix
+            gaps (numpy bool array) - True where the alignment has a gap
+            intervals (list of tuples) - (start, stop) positions of gaps
+            workers (integer) - number of processes to use
+            rows (numpy int array) - indices of the sequences to look at, None for all sequences
+    Return: generator of lists of tuples - result of pull_inserts for each interval, in the same order as intervals
+    """
+    if workers <= 1:
+        for start, stop in intervals:
+            yield pull_inserts(matrix, gaps, start, stop, rows)
+        return
+
+    # Hand out contiguous chunks of intervals; imap returns them in order so IDs are assigned 
+    # exactly as in a serial run
+    size = max(1, len(intervals) // (workers * 8))
+    chunks = [(intervals[i:i+size], rows) for i in range(0, len(intervals), size)]
+    with Pool(workers, initializer=init_worker, initargs=(matrix,)) as pool:
+        for inserts in pool.imap(pull_inserts_chunk, chunks):
+            yield from inserts
+
+def add_inserts(indels, matrix, start, stop, inserts, prefixes):
+    """
+    Description: Add the insertions pulled at a gap to the indel data, skipping any already found there
+    Inputs: indels (dictionary) - indel data from make_indels
+            matrix (numpy uint8 array) - alignment residue matrix
+            start (integer) - start position of gap
+            stop (integer) - stop position of gap
+            inserts (list of tuples) - result of pull_inserts at this gap
+            prefixes (list of lists) - row_prefix of each sequence
+    """
+    found = indels["found"].setdefault((start, stop), {})
+    catalogue = indels["catalogue"]
+    table = indels["table"]
+
+    for index, insertion in inserts:
+        # Only the hash and one sequence with each insertion are kept, the sequence is checked to tell 
+        # apart different insertions with the same hash
+        key = insertion_hash(insertion)
+        rows = found.get(key)
+        if rows is None:
+            found[key] = index
+        else:
+            rows = [rows] if isinstance(rows, int) else rows
+            encoded = insertion.encode("ascii")
+            if any(matrix[row, start:stop].tobytes() == encoded for row in rows):
+                continue
+            found[key] = rows + [index]
 
-    return table, insertion_ID_count, ID_insertion
+        # Add insert to the catalogue if new or update count if already existing 
+        amino_insert = insertion.replace("-","")
+        ID = catalogue.add(amino_insert)
 
+        # Add data to table 
+        table.append(prefixes[index] + [start, ID, len(insertion), len(amino_insert)])
 
-def pull_inserts(index, names, alignments, start, stop, table, next_ID, insertion_ID_count, ID_insertion):
+def row_hashes(matrix):
     """
-    Description: Pull indels at given start and stop positions and add them to the table
-    Inputs: index (integer) - index of the reference sequence (in names and alignments lists)
-            names (list of strings) - headers from fasta file
-            alignments (list of strings) - sequences from the alignment file (in the same order as names)
-            start (integer) - start position of gap
-            stop (integer) - stop position of gap 
-            table (list of lists of strings) - table with indel positions and lengths with 
-                columns: population,individual,allele,position,ID,full length,amino acid length
-            next_ID (integer) - next available ID number (for new indels found)
-            insertion_ID_count (dictionary, key=insertion, value=[ID,count]) - keeps track of the ID and count for each insertion
-            ID_insertion (dictionary, key=ID, value=insertion) - for quick look up of insertion by ID
-    Return: table - same as above, just updated with new indels 
-            insertion_ID_count - same as above, just updated with new indels 
-            ID_insertion - same as above, just updated with new indels 
-    """    
-    found = []
-    
-    # Loop over all sequence in the alignment, skipping the reference sequence
-    for i in range(len(names)):
-        if i == index:
-            continue
+    Description: Hash every sequence of the alignment, to check that they are unchanged when updating
+    Inputs: matrix (numpy uint8 array) - alignment residue matrix
+    Return: hashes (list of strings) - hex digest of each row
+    """
+    return [hashlib.sha256(row.tobytes()).hexdigest() for row in matrix]
 
-        row = []
+def alignment_key(hashes):
+    """
+    Description: Identify an alignment by the row_hashes of its sequences, to recognise it when it is merged into a
+                shared catalogue again
+    Inputs: hashes (list of strings) - row_hashes of the sequences, in alignment order
+    Return: key (int) - 64 bit key
+    """
+    return int.from_bytes(hashlib.blake2b(",".join(hashes).encode("ascii"), digest_size=8).digest(), "little")
 
-        name = names[i]
-        seq = alignments[i]
+def make_indels(samples, names, matrix, workers=1, catalogue=None):
+    """
+    Description: Pull the indel data from every sequence of the alignment
+    Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+            names (list of strings) - headers from fasta file
+            matrix (numpy uint8 array) - alignment residue matrix (rows in the same order as names)
+            workers (integer) - number of processes to pull insertions with
+            catalogue (InsertionCatalogue) - catalogue to take insertion IDs from and add counts to, None for a new one
+    Return: indels (dictionary) - with keys:
+                table (list of lists) - rows of the indel table (see make_table)
+                catalogue (InsertionCatalogue) - ID and count of each insertion
+                found (dictionary, key=(start, stop), value=dictionary) - insertion_hash of each distinct insertion 
+                    (with gaps) found at each gap and the index of a sequence with it, in the order the gaps were found
+                names, hashes (lists of strings) - names and row_hashes of the sequences processed
+                length (integer) - alignment length
+    """
+    matrix = np.asarray(matrix)
+    gaps = matrix == GAP
+    intervals = gap_intervals(gaps)
+    prefixes = [row_prefix(samples, name) for name in names]
 
-        # Pull indel at given start and stop, skipping when indel is also a gap or previously found 
-        insertion = seq[start:stop]
+    if catalogue is None:
+        catalogue = InsertionCatalogue()
+    indels = {"table": [], "catalogue": catalogue, "found": {},
+                "names": list(names), "hashes": row_hashes(matrix), "length": matrix.shape[1]}
 
-        if insertion == "-" * len(insertion) or insertion in found:
-            continue
+    for (start, stop), inserts in zip(intervals, iter_inserts(matrix, gaps, intervals, workers)):
+        add_inserts(indels, matrix, start, stop, inserts, prefixes)
 
-        # Keep a list of indels found at this location so we only count unique ones 
-        found.append(insertion)
+    return indels
 
-        full_insert = insertion
-        amino_insert = insertion.replace("-","")
+def update_indels(samples, indels, names, matrix, workers=1):
+    """
+    Description: Add the sequences appended to an alignment since the indel data was made. Gaps that were already 
+                found are only checked in the new sequences, and gaps only the new sequences have are checked in 
+                every sequence. IDs of insertions that were already found do not change.
+    Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+            indels (dictionary) - indel data from make_indels or load_state (updated in place)
+            names (list of strings) - headers from fasta file, starting with the sequences already processed
+            matrix (numpy uint8 array) - alignment residue matrix (rows in the same order as names)
+    """
+    matrix = np.asarray(matrix)
+    old = len(indels["names"])
+    if (matrix.shape[1] != indels["length"] or list(names[:old]) != indels["names"] 
+            or row_hashes(matrix[:old]) != indels["hashes"]):
+        raise ValueError("Sequences already in the indel state have changed in the alignment, rerun without --update")
+
+    gaps = matrix == GAP
+    prefixes = [row_prefix(samples, name) for name in names]
+
+    # Gaps that were already found only need checking in the new sequences
+    intervals = list(indels["found"])
+    new_rows = np.arange(old, len(names))
+    for (start, stop), inserts in zip(intervals, iter_inserts(matrix, gaps, intervals, workers, new_rows)):
+        add_inserts(indels, matrix, start, stop, inserts, prefixes)
+
+    # Gaps that only the new sequences have need checking in every sequence
+    intervals = [interval for interval in gap_intervals(gaps[old:]) if interval not in indels["found"]]
+    for (start, stop), inserts in zip(intervals, iter_inserts(matrix, gaps, intervals, workers)):
+        add_inserts(indels, matrix, start, stop, inserts, prefixes)
+
+    indels["names"] = list(names)
+    indels["hashes"] += row_hashes(matrix[old:])
+
+def make_table(samples, names, matrix, workers=1):
+    """
+    Description: Make a table of indel data
+    Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+            names (list of strings) - headers from fasta file
+            matrix (numpy uint8 array) - alignment residue matrix (rows in the same order as names)
+            workers (integer) - number of processes to pull insertions with
+    Return: table (list of lists of strings) - table with indel positions and lengths with 
+                columns: population,individual,allele,position,ID,full length,amino acid length
+            catalogue (InsertionCatalogue) - keeps track of the ID and count for each insertion
+    """
+    indels = make_indels(samples, names, matrix, workers)
+    return indels["table"], indels["catalogue"]
 
-        # Add insert to dictionaries if new or update count if already existing 
-        if amino_insert in insertion_ID_count:
-            ID_count = insertion_ID_count[amino_insert]
-            ID = ID_count[0]
-            ID_count[1] += 1
-            insertion_ID_count[amino_insert] = ID_count
-        else:
-            ID = next_ID
-            insertion_ID_count[amino_insert] = [next_ID, 1]
-            ID_insertion[next_ID] = amino_insert
-            next_ID += 1
+def save_state(state_file, indels):
+    """
+    Description: Save the indel data to a state file so that new sequences can be added later with update_indels
+    Inputs: state_file (string) - path to state file (json)
+            indels (dictionary) - indel data from make_indels
+    """
+    state = {
+        "length": indels["length"],
+        "names": indels["names"],
+        "hashes": indels["hashes"],
+        "insertions": [[insertion, count] for ID, count, insertion in indels["catalogue"].items()],
+        "found": [[start, stop, list(found.items())] for (start, stop), found in indels["found"].items()],
+        "table": indels["table"],
+    }
+    temp_file = f"{state_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as file:
+        file.write(json.dumps(state, separators=(",", ":")))
+    os.replace(temp_file, state_file)
+
+def load_state(state_file):
+    """
+    Description: Load indel data saved by save_state
+    Inputs: state_file (string) - path to state file (json)
+    Return: indels (dictionary) - indel data (see make_indels)
+    """
+    with open(state_file) as file:
+        state = json.load(file)
 
-        # Add data to table 
-        individual = int(name.split("_")[0])
-        if individual in pop1:
-            row.append("1")
-        elif individual in pop2:
-            row.append("2")
-        else:
-            print("ISSUE")
+    catalogue = InsertionCatalogue()
+    for insertion, count in state["insertions"]:
+        catalogue.add(insertion, count)
 
-        row += name.split("_")
-        row.append(start)
-        row.append(ID)
-        row.append(len(full_insert))
-        row.append(len(amino_insert))
-        
-        row = [int(x) for x in row]
+    return {"table": state["table"], "catalogue": catalogue, 
+            "found": {(start, stop): dict(found) for start, stop, found in state["found"]},
+            "names": state["names"], "hashes": state["hashes"], "length": state["length"]}
 
-        table.append(row)
+def row_prefix(samples, name):
+    """
+    Description: Population, individual and allele columns of the table for a sequence
+    Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+            name (string) - header of the sequence, format: individual_allele, i.e. 1_1
+    Return: prefix (list) - population (string), individual and allele (integers when numeric)
+    """
+    row = [get_population(samples, name)]
+    for field in name.split("_"):
+        row.append(int(field) if field.isdigit() else field)
+    return row
 
-    return next_ID, insertion_ID_count, ID_insertion
+def table_key(order):
+    """
+    Description: Sort key for rows of the table, putting populations in sample sheet order and numbering 
+                individuals and alleles numerically
+    Inputs: order (dictionary, key=population, value=int) - result of population_order
+    Return: key (function) - takes a table row and returns its sort key
+    """
+    def key(row):
+        fields = [(0, field, "") if isinstance(field, int) else (1, 0, field) for field in row[1:-4]]
+        return [order.get(row[0], len(order)), row[0]] + fields + row[-4:]
+    return key
 
 
-def output_tables(table, csv_file, insertion_ID_count, ID_insertion):
+def output_tables(table, csv_file, catalogue):
     """
     Description: Output tables to csv file to be used in plotting 
     Inputs: table (list of lists of strings) - table with indel positions and lengths with 
                 columns: population,individual,allele,position,ID,full length,amino acid length
             csv_file (string) - path to output csv file 
-            insertion_ID_count (dictionary, key=insertion, value=[ID,count]) - keeps track of the ID and count for each insertion
-            ID_insertion (dictionary, key=ID, value=insertion) - for quick look up of insertion by ID
+            catalogue (InsertionCatalogue) - keeps track of the ID and count for each insertion (insertions with 
+                count 0, i.e. only found in other runs sharing the catalogue, are left out)
     """
     with open(csv_file, "w") as file:
         header = ["Population", "Individual", "Allele", "Position", "ID", "Full Length", "Amino Acid Length"]
@@ -178,20 +316,67 @@ def output_tables(table, csv_file, insertion_ID_count, ID_insertion):
         line = ",".join(header) + "\n"
         file.write(line)
 
-        for ID, insertion in ID_insertion.items():
-            ID_count = insertion_ID_count[insertion]
-            count = ID_count[1]
+        for ID, count, insertion in catalogue.items():
+            if count == 0:
+                continue
             line = f"{ID},{count},{insertion}\n"
 
             file.write(line)
 
 if __name__ == "__main__":
     
-    alignment_file = argv[1]
-    csv_file = argv[2]
-    names, alignments = read_fasta(alignment_file)
-
-    table, insertion_ID_count, ID_insertion = make_table(names, alignments)
-    table.sort()
-
-    output_tables(table, csv_file, insertion_ID_count, ID_insertion)
+    parser = argparse.ArgumentParser(description="Pull all the indels from a multiple sequence alignment")
+    parser.add_argument("alignment_file")
+    parser.add_argument("csv_file")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes to pull insertions with (default: 1)")
+    parser.add_argument("--state", help="indel state file (json) to save the indel data to, for later updates")
+    parser.add_argument("--update", action="store_true", help="only add the sequences appended to the alignment since --state was saved")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLE_SHEET, help="sample sheet csv with Individual and Population columns (default: samples.csv)")
+    parser.add_argument("--catalogue", help="insertion catalogue file (npz) shared across genes and runs, so the same insertion always gets the same ID")
+    parser.add_argument("--source", help="name to count this alignment under in --catalogue, replacing the counts last merged under it (default: path of the alignment file)")
+    args = parser.parse_args()
+    if args.update and not args.state:
+        parser.error("--update requires --state")
+    alignment_file = args.alignment_file
+    csv_file = args.csv_file
+    names, matrix = load_alignment(alignment_file)
+    try:
+        samples = read_sample_sheet(args.samples)
+    except ValueError as error:
+        parser.error(str(error))
+
+    shared = None
+    if args.catalogue:
+        shared = InsertionCatalogue.load(args.catalogue) if os.path.exists(args.catalogue) else InsertionCatalogue()
+
+    try:
+        if args.update:
+            indels = load_state(args.state)
+            catalogue = indels["catalogue"]
+            if shared is not None:
+                catalogue.extend_from(shared)
+            update_indels(samples, indels, names, matrix, args.workers)
+        else:
+            catalogue = InsertionCatalogue()
+            if shared is not None:
+                catalogue.extend_from(shared)
+            indels = make_indels(samples, names, matrix, args.workers, catalogue)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.state:
+        save_state(args.state, indels)
+    if shared is not None:
+        # The catalogue holds the whole alignment's counts (also after --update), which replace the source's last ones
+        source = args.source or os.path.abspath(alignment_file)
+        key = alignment_key(indels["hashes"])
+        previous = shared.sources.get(source)
+        counted_as = catalogue.merge_into(shared, source, key)
+        if counted_as != source:
+            print(f"{alignment_file} was already counted in {args.catalogue} as {counted_as}, its counts were not added again")
+        elif previous is not None and previous[0] != key and not args.update:
+            print(f"Warning: {source} was already counted in {args.catalogue}, its previous counts were replaced")
+        shared.save(args.catalogue)
+
+    table = sorted(indels["table"], key=table_key(population_order(samples)))
+
+    output_tables(table, csv_file, catalogue)
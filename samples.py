@@ -0,0 +1,74 @@
+import csv
+import os
+
+DEFAULT_SAMPLE_SHEET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples.csv")
+
+def read_sample_sheet(sample_file=DEFAULT_SAMPLE_SHEET):
+	"""
+	Description: Read the sample sheet, which lists the population (and any other fields) of every individual
+	Inputs: sample_file (string) - path to csv file with columns Individual,Population and optionally more
+	Return: samples (dictionary, key=individual, value=dictionary of the other columns) - in the order of the sheet
+	"""
+	samples = {}
+	with open(sample_file, newline="") as file:
+		reader = csv.DictReader(file)
+		if reader.fieldnames is None or "Individual" not in reader.fieldnames or "Population" not in reader.fieldnames:
+			raise ValueError(f"Sample sheet {sample_file} needs Individual and Population columns")
+
+		for row in reader:
+			# csv.DictReader fills missing fields with None, and puts extra fields under the key None
+			if None in row or None in row.values():
+				raise ValueError(f"Sample sheet {sample_file} line {reader.line_num}: expected {len(reader.fieldnames)} fields "
+								f"({','.join(reader.fieldnames)})")
+			individual = row.pop("Individual").strip()
+			if not individual:
+				continue
+			if individual in samples:
+				raise ValueError(f"Individual {individual} is listed twice in sample sheet {sample_file}")
+			samples[individual] = {key: value.strip() for key, value in row.items()}
+	return samples
+
+def get_individual(allele):
+	"""
+	Description: Return which individual an allele is from
+	Inputs: allele (string) - name of allele, format: individual_allele, i.e. 1_1
+	Return: individual (string)
+	"""
+	return allele.split("_")[0]
+
+def get_population(samples, allele):
+	"""
+	Description: Return which population an allele is from
+	Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+			allele (string) - name of allele, format: individual_allele, i.e. 1_1
+	Return: population (string)
+	"""
+	individual = get_individual(allele)
+	sample = samples.get(individual)
+	if sample is None:
+		raise ValueError(f"Individual {individual} (allele {allele}) is not in the sample sheet")
+	return sample["Population"]
+
+def check_alleles(samples, alleles, sample_file=DEFAULT_SAMPLE_SHEET):
+	"""
+	Description: Check that the individual of every allele is in the sample sheet, so that a missing one is reported
+				before any work is done (rather than by get_population partway through, possibly in a worker process)
+	Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+			alleles (iterable of strings) - names of the alleles
+			sample_file (string) - path to the sample sheet, for the error message
+	"""
+	missing = [allele for allele in alleles if get_individual(allele) not in samples]
+	if missing:
+		shown = ", ".join(missing[:10]) + (f" and {len(missing) - 10} more" if len(missing) > 10 else "")
+		raise ValueError(f"Individuals of alleles {shown} are not in sample sheet {sample_file}")
+
+def population_order(samples):
+	"""
+	Description: Rank of each population, in the order the populations first appear in the sample sheet
+	Inputs: samples (dictionary) - sample sheet from read_sample_sheet
+	Return: order (dictionary, key=population, value=int)
+	"""
+	order = {}
+	for sample in samples.values():
+		order.setdefault(sample["Population"], len(order))
+	return order
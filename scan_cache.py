@@ -0,0 +1,99 @@
+import hashlib
+import os
+import numpy as np
+from motif_identity import match_counts_batch, percent_table
+
+# THIS MODULE REQUIRES NUMPY
+
+# Kept in the user's cache directory rather than wherever the scripts are run from
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "motif_scan")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def cache_file(cache_dir, seq, motif):
+	"""
+	Description: Path of the cache entry for a sequence and motif
+	Inputs: cache_dir (string) - path to cache directory
+			seq, motif (string)
+	Return: path (string) - <cache_dir>/<sequence hash>_<motif hash>.npy
+	"""
+	seq_hash = hashlib.sha256(seq.encode()).hexdigest()[:32]
+	motif_hash = hashlib.sha256(motif.encode()).hexdigest()[:32]
+	return os.path.join(cache_dir, f"{seq_hash}_{motif_hash}.npy")
+
+def load_counts(path):
+	"""
+	Description: Read a cache entry and mark it as recently used
+	Inputs: path (string) - path to cache entry
+	Return: counts (numpy int array) - match counts for every window, None if the entry is not cached
+	"""
+	try:
+		counts = np.load(path)
+		os.utime(path)
+	except (OSError, ValueError):
+		return None
+	return counts
+
+def save_counts(path, counts):
+	"""
+	Description: Write a cache entry (atomically, so other processes never see a partial file)
+	Inputs: path (string) - path to cache entry
+			counts (numpy int array) - match counts for every window
+	"""
+	dtype = np.uint16 if len(counts) == 0 or counts.max() < 1 << 16 else np.int64
+	temp_file = f"{path}.{os.getpid()}.tmp.npy"
+	np.save(temp_file, counts.astype(dtype))
+	os.replace(temp_file, path)
+
+def evict(cache_dir, max_bytes):
+	"""
+	Description: Remove the least recently used cache entries until the cache is no larger than max_bytes
+	Inputs: cache_dir (string) - path to cache directory (nothing is done if it does not exist)
+			max_bytes (int) - size limit of the cache
+	"""
+	entries = []
+	total = 0
+	try:
+		scan = os.scandir(cache_dir)
+	except FileNotFoundError:
+		return
+	with scan:
+		for entry in scan:
+			if entry.name.endswith(".npy") and not entry.name.endswith(".tmp.npy"):
+				try:
+					stat = entry.stat()
+				except OSError:
+					continue
+				entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+				total += stat.st_size
+
+	entries.sort()
+	for mtime, size, path in entries:
+		if total <= max_bytes:
+			break
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		total -= size
+
+def cached_identity_tracks(seq, motifs, cache_dir=DEFAULT_CACHE_DIR):
+	"""
+	Description: Calculate the percent identity tracks of several motifs against the seq, reading any that were
+				computed before from the cache and saving the rest to it. The cache is not trimmed here; call evict
+				once after a scan.
+	Inputs: seq (string)
+			motifs (list of strings)
+			cache_dir (string) - path to cache directory (created if missing)
+	Return: tracks (list of numpy float arrays) - identity_track(seq, motif) for each motif (in the same order as motifs)
+	"""
+	os.makedirs(cache_dir, exist_ok=True)
+	paths = [cache_file(cache_dir, seq, motif) for motif in motifs]
+	counts = [load_counts(path) for path in paths]
+
+	missing = [i for i, count in enumerate(counts) if count is None]
+	if missing:
+		for i, count in zip(missing, match_counts_batch(seq, [motifs[i] for i in missing])):
+			save_counts(paths[i], count)
+			counts[i] = count
+
+	return [percent_table(len(motif))[count] for motif, count in zip(motifs, counts)]
@@ -0,0 +1,174 @@
+import os
+import stat
+import sys
+import time
+import pytest
+from aligner import align, align_many, align_stream
+from fasta import read_fasta
+
+# Stands in for MUSCLE: pads the sequences to the same length, fails on sequences containing FAIL and hangs on
+# sequences containing SLOW (writing its process ID to slow first). Every alignment it runs is logged to calls next to it.
+FAKE_ALIGNER = """#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if args == ["-version"]:
+	print("fake aligner 1.0")
+	sys.exit()
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "calls"), "a") as log:
+	log.write(" ".join(args) + "\\n")
+with open(args[args.index("-align") + 1]) as file:
+	text = file.read()
+if "FAIL" in text:
+	sys.stderr.write("bad input\\n")
+	sys.exit(3)
+if "SLOW" in text:
+	with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow"), "w") as file:
+		file.write(str(os.getpid()))
+	time.sleep(30)
+records = [record.split("\\n", 1) for record in text.split(">")[1:]]
+records = [(name, seq.replace("\\n", "")) for name, seq in records]
+length = max(len(seq) for name, seq in records)
+with open(args[args.index("-output") + 1], "w") as output:
+	for name, seq in records:
+		output.write(f">{{name}}\\n{{seq.ljust(length, '-')}}\\n")
+"""
+
+@pytest.fixture
+def fake_aligner(tmp_path):
+	executable = tmp_path / "bin" / "fake_muscle"
+	executable.parent.mkdir()
+	executable.write_text(FAKE_ALIGNER.format(python=sys.executable))
+	executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+	return str(executable)
+
+# Stands in for MAFFT, a shell script that runs the alignment in a child process
+WRAPPER = """#!/bin/bash
+"$(dirname "$0")/fake_muscle" "$@"
+"""
+
+@pytest.fixture
+def wrapped_aligner(tmp_path, fake_aligner):
+	executable = tmp_path / "bin" / "fake_wrapper"
+	executable.write_text(WRAPPER)
+	executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+	return str(executable)
+
+def slow_process(executable):
+	with open(os.path.join(os.path.dirname(executable), "slow")) as file:
+		return int(file.read())
+
+def running(pid):
+	# A killed process is gone once it has been reaped, or lingers as a zombie (state Z) until then
+	for _ in range(50):
+		try:
+			with open(f"/proc/{pid}/stat") as file:
+				state = file.read().rsplit(")", 1)[1].split()[0]
+		except FileNotFoundError:
+			return False
+		if state == "Z":
+			return False
+		time.sleep(0.1)
+	return True
+
+def calls(executable):
+	path = os.path.join(os.path.dirname(executable), "calls")
+	if not os.path.exists(path):
+		return 0
+	with open(path) as file:
+		return len(file.readlines())
+
+def write_pair(path, seq1="MKVLA", seq2="MKA"):
+	path.write_text(f">1_1\n{seq1}\n>1_2\n{seq2}\n")
+	return str(path)
+
+def test_align_caches_alignment(tmp_path, fake_aligner):
+	fasta_file = write_pair(tmp_path / "pair.fasta")
+	cache_dir = str(tmp_path / "cache")
+
+	assert not align(fasta_file, str(tmp_path / "first.fasta"), executable=fake_aligner, cache_dir=cache_dir)
+	assert align(fasta_file, str(tmp_path / "second.fasta"), executable=fake_aligner, cache_dir=cache_dir)
+	assert calls(fake_aligner) == 1
+	assert read_fasta(str(tmp_path / "first.fasta")) == read_fasta(str(tmp_path / "second.fasta")) == (["1_1", "1_2"], ["MKVLA", "MKA--"])
+
+def test_align_reruns_changed_input(tmp_path, fake_aligner):
+	cache_dir = str(tmp_path / "cache")
+	align(write_pair(tmp_path / "pair.fasta"), str(tmp_path / "first.fasta"), executable=fake_aligner, cache_dir=cache_dir)
+
+	fasta_file = write_pair(tmp_path / "pair.fasta", seq2="MKVL")
+	assert not align(fasta_file, str(tmp_path / "second.fasta"), executable=fake_aligner, cache_dir=cache_dir)
+	assert calls(fake_aligner) == 2
+	assert read_fasta(str(tmp_path / "second.fasta"))[1] == ["MKVLA", "MKVL-"]
+
+def test_align_without_cache(tmp_path, fake_aligner):
+	fasta_file = write_pair(tmp_path / "pair.fasta")
+	for i in range(2):
+		assert not align(fasta_file, str(tmp_path / "out.fasta"), executable=fake_aligner, cache_dir=None)
+	assert calls(fake_aligner) == 2
+
+def test_align_failure(tmp_path, fake_aligner):
+	fasta_file = write_pair(tmp_path / "pair.fasta", seq1="FAIL")
+	alignment_file = tmp_path / "out.fasta"
+	cache_dir = tmp_path / "cache"
+
+	with pytest.raises(RuntimeError, match=r"exit code 3\): bad input"):
+		align(fasta_file, str(alignment_file), executable=fake_aligner, cache_dir=str(cache_dir))
+	# Nothing is written or cached for a failed alignment, so a rerun tries again
+	assert not alignment_file.exists()
+	assert not cache_dir.exists() or os.listdir(cache_dir) == []
+	with pytest.raises(RuntimeError):
+		align(fasta_file, str(alignment_file), executable=fake_aligner, cache_dir=str(cache_dir))
+	assert calls(fake_aligner) == 2
+
+def test_align_timeout(tmp_path, fake_aligner):
+	fasta_file = write_pair(tmp_path / "pair.fasta", seq1="SLOW")
+	alignment_file = tmp_path / "out.fasta"
+
+	with pytest.raises(RuntimeError, match="timed out after 0.5 seconds"):
+		align(fasta_file, str(alignment_file), executable=fake_aligner, timeout=0.5, cache_dir=None)
+	assert not alignment_file.exists()
+	assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+def test_align_timeout_kills_child_processes(tmp_path, wrapped_aligner):
+	fasta_file = write_pair(tmp_path / "pair.fasta", seq1="SLOW")
+	start = time.monotonic()
+	with pytest.raises(RuntimeError, match="timed out after 1 seconds"):
+		align(fasta_file, str(tmp_path / "out.fasta"), executable=wrapped_aligner, timeout=1, cache_dir=None)
+	assert time.monotonic() - start < 10
+	assert not running(slow_process(wrapped_aligner))
+
+def test_align_missing_executable(tmp_path):
+	fasta_file = write_pair(tmp_path / "pair.fasta")
+	with pytest.raises(RuntimeError, match="Could not run muscle"):
+		align(fasta_file, str(tmp_path / "out.fasta"), executable=str(tmp_path / "missing"), cache_dir=None)
+
+def test_align_many_reports_each_job(tmp_path, fake_aligner):
+	jobs = [(write_pair(tmp_path / f"{name}.fasta", seq1=seq1), str(tmp_path / f"{name}.aln"))
+			for name, seq1 in [("good", "MKVLA"), ("bad", "FAIL"), ("slow", "SLOW")]]
+	errors = align_many(jobs, executable=fake_aligner, workers=3, timeout=2, cache_dir=None)
+
+	assert errors[0] is None
+	assert "exit code 3" in str(errors[1])
+	assert "timed out" in str(errors[2])
+	assert read_fasta(jobs[0][1])[1] == ["MKVLA", "MKA--"]
+
+def test_align_stream(fake_aligner):
+	assert align_stream([("b", "MK"), ("a", "MKVL")], executable=fake_aligner) == ["MK--", "MKVL"]
+
+def test_align_stream_failure(fake_aligner):
+	with pytest.raises(RuntimeError, match=r"exit code 3\): bad input"):
+		align_stream([("a", "FAIL"), ("b", "MK")], executable=fake_aligner)
+	with pytest.raises(RuntimeError, match="timed out"):
+		align_stream([("a", "SLOW"), ("b", "MK")], executable=fake_aligner, timeout=0.5)
+
+def test_align_stream_timeout_kills_child_processes(wrapped_aligner):
+	start = time.monotonic()
+	with pytest.raises(RuntimeError, match="timed out"):
+		align_stream([("a", "SLOW"), ("b", "MK")], executable=wrapped_aligner, timeout=1)
+	# The wrapper's child holds stdout open, so the output only ends once it is killed as well
+	assert time.monotonic() - start < 10
+	assert not running(slow_process(wrapped_aligner))
+
+def test_align_stream_duplicate_names(fake_aligner):
+	with pytest.raises(ValueError, match="unique"):
+		align_stream([("x", "AAA"), ("x", "CCC")], executable=fake_aligner)
+	assert calls(fake_aligner) == 0
@@ -0,0 +1,98 @@
+import random
+import pytest
+from pairwise_aligner import BLOSUM62, global_align
+
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+PENALTIES = [(11, 1), (5, 2), (3, 3), (10, 0)]
+
+def substitution(a, b):
+	residues, scores = BLOSUM62
+	return int(scores[residues.index(a), residues.index(b)])
+
+def reference_score(seq1, seq2, gap_open, gap_extend):
+	"""
+	Description: Score of the best global alignment from the full (unbanded) affine gap dynamic programming matrices
+	"""
+	n, m = len(seq1), len(seq2)
+	neg = -10**9
+	H = [[neg] * (m + 1) for _ in range(n + 1)]
+	E = [[neg] * (m + 1) for _ in range(n + 1)]
+	F = [[neg] * (m + 1) for _ in range(n + 1)]
+	H[0][0] = 0
+	for i in range(n + 1):
+		for j in range(m + 1):
+			if i == 0 and j == 0:
+				continue
+			if j > 0:
+				E[i][j] = max(H[i][j-1] - gap_open, E[i][j-1] - gap_extend)
+			if i > 0:
+				F[i][j] = max(H[i-1][j] - gap_open, F[i-1][j] - gap_extend)
+			diagonal = H[i-1][j-1] + substitution(seq1[i-1], seq2[j-1]) if i > 0 and j > 0 else neg
+			H[i][j] = max(E[i][j], F[i][j], diagonal)
+	return H[n][m]
+
+def alignment_score(aligned1, aligned2, gap_open, gap_extend):
+	score = 0
+	previous = None
+	for a, b in zip(aligned1, aligned2):
+		if a == "-" or b == "-":
+			gap = 1 if a == "-" else 2
+			score -= gap_extend if previous == gap else gap_open
+			previous = gap
+		else:
+			score += substitution(a, b)
+			previous = None
+	return score
+
+def check(seq1, seq2, gap_open, gap_extend, band):
+	aligned1, aligned2, score = global_align(seq1, seq2, gap_open=gap_open, gap_extend=gap_extend, band=band)
+	assert aligned1.replace("-", "") == seq1 and aligned2.replace("-", "") == seq2
+	assert len(aligned1) == len(aligned2)
+	assert alignment_score(aligned1, aligned2, gap_open, gap_extend) == score
+	return score
+
+def random_seq(rng, length):
+	return "".join(rng.choice(RESIDUES) for _ in range(length))
+
+def test_matches_reference_on_edited_sequences():
+	rng = random.Random(1)
+	for _ in range(300):
+		seq1 = random_seq(rng, rng.randint(0, 30))
+		seq2 = list(seq1)
+		for _ in range(rng.randint(0, 6)):
+			p = rng.randint(0, len(seq2))
+			r = rng.random()
+			if r < .4:
+				seq2[p:p] = random_seq(rng, rng.randint(1, 8))
+			elif r < .8:
+				del seq2[p:p + rng.randint(1, 8)]
+			elif seq2:
+				seq2[min(p, len(seq2) - 1)] = rng.choice(RESIDUES)
+		seq2 = "".join(seq2)
+		gap_open, gap_extend = rng.choice(PENALTIES)
+		band = rng.choice([1, 2, 5, None])
+		assert check(seq1, seq2, gap_open, gap_extend, band) == reference_score(seq1, seq2, gap_open, gap_extend)
+
+def test_matches_reference_on_offset_insertions():
+	# An insertion in one allele followed by a different insertion in the other takes the best alignment far off the
+	# diagonal of the length difference, while a narrow band still finds a worse alignment that stays near it
+	rng = random.Random(5)
+	for _ in range(100):
+		core = [random_seq(rng, rng.randint(10, 50)) for _ in range(3)]
+		insertion1, insertion2 = random_seq(rng, rng.randint(10, 50)), random_seq(rng, rng.randint(10, 50))
+		seq1 = core[0] + insertion1 + core[1] + core[2]
+		seq2 = core[0] + core[1] + insertion2 + core[2]
+		if rng.random() < .5:
+			seq1, seq2 = seq2, seq1
+		gap_open, gap_extend = rng.choice(PENALTIES)
+		band = rng.choice([1, 3, 10])
+		assert check(seq1, seq2, gap_open, gap_extend, band) == reference_score(seq1, seq2, gap_open, gap_extend)
+
+@pytest.mark.parametrize("band", [50, 100, 200])
+def test_long_offset_insertions(band):
+	# 1050 and 950 residue alleles: a 250 residue insertion in the first, and a 150 residue insertion after it in the second
+	rng = random.Random(0)
+	core1, core2 = random_seq(rng, 400), random_seq(rng, 400)
+	seq1 = core1 + random_seq(rng, 250) + core2
+	seq2 = core1 + core2 + random_seq(rng, 150)
+	assert check(seq1, seq2, 11, 1, band) == check(seq1, seq2, 11, 1, None)
@@ -0,0 +1,86 @@
+import random
+import numpy as np
+import pytest
+from pull_indels import load_state, make_indels, save_state, update_indels
+
+RESIDUES = "ACDE"
+SAMPLES = {str(individual): {"Population": "AB"[individual % 2]} for individual in range(1, 11)}
+
+def random_alignment(rng, rows, length=60):
+	"""
+	Description: Alignment of edited copies of one sequence, where the gaps come from a small set of intervals so that
+				the same gaps (and the same insertions) turn up in many sequences
+	"""
+	base = [rng.choice(RESIDUES) for _ in range(length)]
+	intervals = []
+	for _ in range(6):
+		start = rng.randrange(length - 1)
+		intervals.append((start, min(length, start + rng.randint(1, 8))))
+	names = []
+	seqs = []
+	for row in range(rows):
+		seq = [residue if rng.random() > .05 else rng.choice(RESIDUES) for residue in base]
+		for start, stop in rng.sample(intervals, rng.randint(0, 3)):
+			seq[start:stop] = "-" * (stop - start)
+		names.append(f"{row // 2 + 1}_{row % 2 + 1}")
+		seqs.append(seq)
+	return names, np.array([[ord(residue) for residue in seq] for seq in seqs], dtype=np.uint8)
+
+def by_insertion(indels):
+	"""
+	Description: Indel table and catalogue counts with each ID replaced by its insertion, since IDs depend on the order
+				insertions were found in
+	"""
+	catalogue = indels["catalogue"]
+	table = sorted(row[:4] + [catalogue[row[4]]] + row[5:] for row in indels["table"])
+	counts = {insertion: count for ID, count, insertion in catalogue.items()}
+	return table, counts
+
+@pytest.mark.parametrize("seed", range(20))
+def test_update_matches_full_rerun(tmp_path, seed):
+	rng = random.Random(seed)
+	names, matrix = random_alignment(rng, 20)
+	old = rng.randint(1, 19)
+
+	indels = make_indels(SAMPLES, names[:old], matrix[:old])
+	save_state(str(tmp_path / "state.json"), indels)
+	indels = load_state(str(tmp_path / "state.json"))
+	update_indels(SAMPLES, indels, names, matrix)
+
+	assert by_insertion(indels) == by_insertion(make_indels(SAMPLES, names, matrix))
+
+def test_update_in_steps_keeps_ids(tmp_path):
+	rng = random.Random(1)
+	names, matrix = random_alignment(rng, 20)
+	indels = make_indels(SAMPLES, names[:4], matrix[:4])
+	for rows in [8, 9, 15, 20]:
+		before = list(indels["catalogue"].insertions)
+		update_indels(SAMPLES, indels, names[:rows], matrix[:rows])
+		save_state(str(tmp_path / "state.json"), indels)
+		indels = load_state(str(tmp_path / "state.json"))
+		assert indels["catalogue"].insertions[:len(before)] == before
+	assert by_insertion(indels) == by_insertion(make_indels(SAMPLES, names, matrix))
+
+def test_update_rejects_changed_sequences():
+	rng = random.Random(2)
+	names, matrix = random_alignment(rng, 10)
+	indels = make_indels(SAMPLES, names[:5], matrix[:5])
+	changed = matrix.copy()
+	changed[2, changed[2] != ord("-")] = ord("W")
+	with pytest.raises(ValueError, match="rerun without --update"):
+		update_indels(SAMPLES, indels, names, changed)
+
+def test_workers_match_serial():
+	rng = random.Random(3)
+	names, matrix = random_alignment(rng, 20, length=200)
+	serial = make_indels(SAMPLES, names, matrix)
+	parallel = make_indels(SAMPLES, names, matrix, workers=3)
+	assert parallel["table"] == serial["table"]
+	assert list(parallel["catalogue"].items()) == list(serial["catalogue"].items())
+
+	indels = make_indels(SAMPLES, names[:7], matrix[:7], workers=3)
+	update_indels(SAMPLES, indels, names, matrix, workers=3)
+	expected = make_indels(SAMPLES, names[:7], matrix[:7])
+	update_indels(SAMPLES, expected, names, matrix)
+	assert indels["table"] == expected["table"]
+	assert list(indels["catalogue"].items()) == list(expected["catalogue"].items())